@@ -0,0 +1,178 @@
+"""ASGI entry point for the library API
+
+Serves the routes of index.py from an asyncio event loop:
+
+    uvicorn asgi:app --app-dir api
+
+(uvicorn[standard] brings the httptools parser and uvloop, which roughly
+double throughput over the pure-Python defaults.)
+Views run on a thread pool, so a slow request never holds up the loop,
+and response bodies are pulled from the pool chunk by chunk, so long
+listings, searches and exports stream while other requests proceed.
+Unless LIBRARY_PERSISTENCE says otherwise the library is persisted in
+"background" mode: a write returns once the change is in memory and a
+writer thread saves bursts of changes in one snapshot. Add ?durable=1
+to a write to have it answer only once the change is on disk.
+"""
+import asyncio
+import concurrent.futures
+import io
+import os
+import sys
+
+os.environ.setdefault("LIBRARY_PERSISTENCE", "background")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import index  # noqa: E402
+
+ASGI_THREADS = int(os.environ.get("LIBRARY_ASGI_THREADS", "32"))   # views run concurrently
+
+_executor = concurrent.futures.ThreadPoolExecutor(ASGI_THREADS, thread_name_prefix="library-asgi")
+
+
+class RequestBody(io.RawIOBase):
+    """wsgi.input for a view on the thread pool, fed from the ASGI receive channel
+
+    Each read waits on the event loop for the next chunk of the upload,
+    so a view that reads the body as a stream (the bulk import) never
+    holds all of it in memory. A client that disconnects ends the body.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = b""
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and not self._done:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.disconnect":
+                self._done = True
+                break
+            self._chunk = message.get("body", b"")
+            self._done = not message.get("more_body")
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ Flask expects for an ASGI http scope
+
+    body is the request body as a binary file. The server ends it
+    (wsgi.input_terminated), so a chunked upload without a
+    Content-Length is read to its end.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def call_view(environ):
+    """Run the Flask app on one request; return status, headers and the body
+
+    The body is bytes when the response has a known length, otherwise
+    the iterable that streams it.
+    """
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                              for name, value in headers]
+
+    body = index.app.wsgi_app(environ, start_response)
+    if any(name == b"content-length" for name, _ in started["headers"]):
+        try:
+            return started["status"], started["headers"], b"".join(body)
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+    return started["status"], started["headers"], body
+
+
+async def serve_http(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    body = io.BufferedReader(RequestBody(receive, loop))
+    status, headers, response = await loop.run_in_executor(
+        _executor, call_view, wsgi_environ(scope, body))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    if isinstance(response, bytes):
+        await send({"type": "http.response.body", "body": response})
+        return
+    try:
+        chunks = iter(response)
+        while True:
+            chunk = await loop.run_in_executor(_executor, next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(response, "close"):
+            await loop.run_in_executor(_executor, response.close)
+
+
+def close_libraries():
+    index.library_pool.close_all()
+    index.library.close()
+
+
+async def serve_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Pending background saves are written out before the server exits
+            await asyncio.get_running_loop().run_in_executor(_executor, close_libraries)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application"""
+    if scope["type"] == "http":
+        await serve_http(scope, receive, send)
+    elif scope["type"] == "lifespan":
+        await serve_lifespan(receive, send)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("Serving the ASGI app needs an ASGI server: pip install uvicorn")
+        sys.exit(1)
+    uvicorn.run(app, port=5328)
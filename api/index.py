@@ -1,78 +1,2845 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify
+import array
+import base64
+import binascii
+import atexit
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
+import csv
+import functools
+import gc
+import hashlib
+import io
+import heapq
+import itertools
 import json
+import marshal
+import math
+import mmap
+import multiprocessing
 import os
-from datetime import datetime
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import date
+
+try:
+    import fcntl
+except ImportError:     # Windows: no flock, so no shared persistence
+    fcntl = None
 
 app = Flask(__name__)
 
+def _intern(value):
+    """Share one copy of frequently repeated strings (genres, statuses, authors)"""
+    return sys.intern(value) if type(value) is str else value
+
+
 # Book class from our previous implementation
+FRAGMENT_CACHE = os.environ.get("LIBRARY_FRAGMENT_CACHE", "1") != "0"
+# Keys in the sorted order jsonify writes them
+_BOOK_JSON = ('{"author":%s,"date_added":%s,"genre":%s,"isbn":%s,"notes":%s,'
+              '"publication_year":%s,"status":%s,"title":%s}')
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def _json_value(value):
+    if type(value) is str:
+        return _encode_string(value)
+    if value is None:
+        return "null"
+    if type(value) is int:
+        return str(value)
+    return json.dumps(value)
+
+
 class Book:
+    FIELDS = ("title", "author", "isbn", "genre", "publication_year",
+              "status", "notes", "_date_added")
+    # No per-instance __dict__: at millions of books it dominates memory.
+    # _json caches the encoded book; see to_json
+    __slots__ = FIELDS + ("_json",)
+
     def __init__(self, title, author, isbn="", 
                  genre="", publication_year=None, 
                  status="Available", notes=""):
         self.title = title
-        self.author = author
+        self.author = _intern(author)
         self.isbn = isbn
-        self.genre = genre
+        self.genre = _intern(genre)
         self.publication_year = publication_year
-        self.status = status
+        self.status = _intern(status)
         self.notes = notes
-        self.date_added = datetime.now().strftime("%Y-%m-%d")
+        self._date_added = date.today().toordinal()
+        self._json = None
+
+    @property
+    def date_added(self):
+        """The date the book was added, as YYYY-MM-DD"""
+        if type(self._date_added) is int:
+            return date.fromordinal(self._date_added).isoformat()
+        return self._date_added
+
+    @date_added.setter
+    def date_added(self, value):
+        # Stored as a day ordinal; other text is kept verbatim, other
+        # values (null in older files) as text
+        if type(value) is not str:
+            value = "" if value is None else str(value)
+        try:
+            parsed = date.fromisoformat(value)
+        except ValueError:
+            parsed = None
+        if parsed is not None and parsed.isoformat() == value:
+            self._date_added = parsed.toordinal()
+        else:
+            self._date_added = value
+        self._json = None
         
     def to_dict(self):
         """Convert book object to dictionary for JSON serialization"""
         return {
-            "title": self.title,
-            "author": self.author,
-            "isbn": self.isbn,
-            "genre": self.genre,
-            "publication_year": self.publication_year,
-            "status": self.status,
-            "notes": self.notes,
-            "date_added": self.date_added
+            "title": self.title,
+            "author": self.author,
+            "isbn": self.isbn,
+            "genre": self.genre,
+            "publication_year": self.publication_year,
+            "status": self.status,
+            "notes": self.notes,
+            "date_added": self.date_added
+        }
+
+    def to_json(self):
+        """to_dict() as compact JSON bytes, byte-for-byte what jsonify produces
+
+        The encoding is cached until the book changes; whoever changes a
+        field other than through date_added must reset _json.
+        """
+        encoded = self._json
+        if encoded is None:
+            encoded = _BOOK_JSON % (
+                _json_value(self.author), _json_value(self.date_added), _json_value(self.genre),
+                _json_value(self.isbn), _json_value(self.notes),
+                _json_value(self.publication_year), _json_value(self.status),
+                _json_value(self.title))
+            encoded = encoded.encode()
+            if FRAGMENT_CACHE:
+                self._json = encoded
+        return encoded
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Create a Book object from dictionary data"""
+        book = cls(
+            title=_text(data["title"]),
+            author=_text(data["author"]),
+            isbn=_text(data.get("isbn", "")),
+            genre=_text(data.get("genre", "")),
+            publication_year=_year(data.get("publication_year")),
+            status=_text(data.get("status", "Available")),
+            notes=_text(data.get("notes", ""))
+        )
+        book.date_added = data.get("date_added", book.date_added)
+        return book
+
+
+def _text(value):
+    # Older files may hold null titles or non-string fields
+    return "" if value is None else str(value)
+
+
+def _year(value):
+    """A publication year as int or None; older files may hold it as a string"""
+    if value is None or type(value) is int:
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+
+def check_book(book):
+    """Raise ValueError unless every field has the type the indexes need"""
+    for field in ("title", "author", "isbn", "genre", "status", "notes"):
+        if type(getattr(book, field)) is not str:
+            raise ValueError(f"Invalid {field}: {getattr(book, field)!r}")
+    if book.publication_year is not None and type(book.publication_year) is not int:
+        raise ValueError(f"Invalid publication year: {book.publication_year!r}")
+    if type(book._date_added) not in (int, str):
+        raise ValueError(f"Invalid date added: {book._date_added!r}")
+
+
+def check_status(status):
+    """Raise ValueError unless status is a non-empty string"""
+    if type(status) is not str or not status:
+        raise ValueError(f"Invalid status: {status!r}")
+
+
+def book_output(books, as_books=False):
+    """Books as dicts, or the Book objects themselves for encode_json"""
+    return list(books) if as_books else [book.to_dict() for book in books]
+
+
+STREAM_CHUNK = 64 * 1024    # bytes per chunk of an encoded response
+
+
+def _json_default(value):
+    if isinstance(value, Book):
+        return value.to_dict()
+    return app.json.default(value)
+
+
+def encode_json(value, lock=contextlib.nullcontext):
+    """Yield value encoded exactly as jsonify would, in chunks of about STREAM_CHUNK
+
+    Lists of Books are joined from their cached to_json() fragments,
+    EXPORT_BATCH books at a time under lock(), so no fragment is encoded
+    while a writer is changing the book.
+    """
+    json_provider = app.json
+    if json_provider.compact is False or (json_provider.compact is None and app.debug):
+        yield (json_provider.dumps(value, indent=2, default=_json_default) + "\n").encode()
+        return
+    pending, size = [], 0
+    for part in _encode_parts(value, lock):
+        pending.append(part)
+        size += len(part)
+        if size >= STREAM_CHUNK:
+            yield b"".join(pending)
+            pending, size = [], 0
+    pending.append(b"\n")
+    yield b"".join(pending)
+
+
+def _encode_parts(value, lock):
+    if type(value) is list and value and isinstance(value[0], Book):
+        yield b"["
+        for start in range(0, len(value), EXPORT_BATCH):
+            with lock():
+                batch = b",".join([book.to_json() for book in value[start:start + EXPORT_BATCH]])
+            yield b"," + batch if start else batch
+        yield b"]"
+    elif type(value) is dict and value and all(type(key) is str for key in value):
+        separator = b"{"
+        for key in sorted(value):
+            yield separator + _encode_string(key).encode() + b":"
+            yield from _encode_parts(value[key], lock)
+            separator = b","
+        yield b"}"
+    else:
+        yield app.json.dumps(value, separators=(",", ":"), default=_json_default).encode()
+
+# Search modes: "index" uses the inverted index, "substring" scans every book,
+# "fuzzy" tolerates typos in titles and authors via a trigram index
+SEARCH_MODE = os.environ.get("LIBRARY_SEARCH_MODE", "index")
+FUZZY_THRESHOLD = 0.3    # minimum trigram similarity for a fuzzy term match
+FIELD_WEIGHTS = {"title": 3, "author": 2, "genre": 1, "isbn": 1}
+FUZZY_FIELDS = ("title", "author")
+# A posting scoring this much includes a fuzzy field (genre and ISBN add 1 each,
+# and an ISBN token is never also a genre word)
+FUZZY_MIN_SCORE = min(FIELD_WEIGHTS[field] for field in FUZZY_FIELDS)
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+class TrigramIndex:
+    """Character trigrams of a token vocabulary, for typo-tolerant lookups
+
+    Indexing the vocabulary rather than the books keeps the index small
+    and candidate generation cheap: a query term is compared only with
+    tokens that share at least one trigram with it. Tokens are reference
+    counted so one index can follow books being added and removed.
+    """
+
+    def __init__(self):
+        self.grams = {}    # trigram -> {trigram count: set of tokens containing it}
+        self.sizes = {}    # token -> number of distinct trigrams
+        self.refs = {}     # token -> number of times it was added
+
+    @staticmethod
+    def trigrams(token):
+        # Padded like pg_trgm, so word starts weigh more than word ends
+        padded = "  " + token + " "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, token):
+        self.refs[token] = self.refs.get(token, 0) + 1
+        if token in self.sizes:
+            return
+        grams = self.trigrams(token)
+        size = self.sizes[token] = len(grams)
+        for gram in grams:
+            by_size = self.grams.get(gram)
+            if by_size is None:
+                by_size = self.grams[gram] = {}
+            tokens = by_size.get(size)
+            if tokens is None:
+                tokens = by_size[size] = set()
+            tokens.add(token)
+
+    def remove(self, token):
+        refs = self.refs.get(token, 0) - 1
+        if refs > 0:
+            self.refs[token] = refs
+            return
+        self.refs.pop(token, None)
+        size = self.sizes.pop(token, None)
+        if size is None:
+            return
+        for gram in self.trigrams(token):
+            by_size = self.grams.get(gram, {})
+            tokens = by_size.get(size)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del by_size[size]
+                    if not by_size:
+                        del self.grams[gram]
+
+    def similar(self, term, threshold=FUZZY_THRESHOLD):
+        """Return {token: similarity} for tokens at least threshold alike
+
+        Similarity is the Jaccard index of the two trigram sets. For a
+        token with m trigrams to reach the threshold it must share at
+        least ceil(threshold * (n + m) / (1 + threshold)) of the term's n
+        trigrams, so candidates of each size are only collected from the
+        term's rarest trigrams; the common ones are just probed.
+        """
+        grams = sorted(self.trigrams(term), key=lambda gram: sum(
+            len(tokens) for tokens in self.grams.get(gram, {}).values()))
+        n = len(grams)
+        sizes = set()
+        for gram in grams:
+            sizes.update(self.grams.get(gram, ()))
+        matches = {}
+        for size in sizes:
+            needed = max(math.ceil(threshold * (n + size) / (1 + threshold) - 1e-9), 1)
+            if needed > min(n, size):
+                continue
+            prefix = n - needed + 1
+            shared = {}
+            for gram in grams[:prefix]:
+                for token in self.grams.get(gram, {}).get(size, ()):
+                    shared[token] = shared.get(token, 0) + 1
+            for gram in grams[prefix:]:
+                tokens = self.grams.get(gram, {}).get(size, ())
+                for token in shared:
+                    if token in tokens:
+                        shared[token] += 1
+            for token, count in shared.items():
+                similarity = count / (n + size - count)
+                if similarity >= threshold:
+                    matches[token] = similarity
+        return matches
+
+
+def fuzzy_rank(books, term_matches, limit=None):
+    """Rank (book id, book) pairs by how well their titles and authors match
+
+    term_matches holds one {token: similarity} map per query term. Every
+    term must match some title or author token; a book scores the mean of
+    its best similarity per term, as in SearchIndex.fuzzy_search.
+    """
+    scored = []
+    for book_id, book in books:
+        tokens = set(tokenize(book.title))
+        tokens.update(tokenize(book.author))
+        total = 0
+        for matches in term_matches:
+            best = max((matches[token] for token in tokens if token in matches), default=0)
+            if not best:
+                break
+            total += best
+        else:
+            scored.append((-total / len(term_matches), book_id, book))
+    ranked = heapq.nsmallest(limit, scored) if limit is not None else sorted(scored)
+    return [book for _, _, book in ranked]
+
+
+class SearchIndex:
+    """Inverted index from tokens to book ids with per-field weights"""
+
+    def __init__(self):
+        self.postings = {}     # token -> {book id: score}
+        self.vocabulary = []   # sorted tokens, for prefix lookups
+        self.trigrams = TrigramIndex()
+        self.bulk = False      # while set, new tokens are appended unsorted
+
+    def _book_tokens(self, book):
+        scores = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            value = getattr(book, field) or ""
+            tokens = set(tokenize(value))
+            if field == "isbn" and value:
+                tokens.add(value.lower())
+            for token in tokens:
+                scores[token] = scores.get(token, 0) + weight
+        return scores
+
+    def add(self, book_id, book):
+        for token, score in self._book_tokens(book).items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                if self.bulk:
+                    self.vocabulary.append(token)
+                else:
+                    bisect.insort(self.vocabulary, token)
+            posting[book_id] = score
+            if score >= FUZZY_MIN_SCORE:
+                self.trigrams.add(token)
+
+    def remove(self, book_id, book):
+        for token, score in self._book_tokens(book).items():
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(book_id, None)
+            if score >= FUZZY_MIN_SCORE:
+                self.trigrams.remove(token)
+            if not posting:
+                del self.postings[token]
+                i = bisect.bisect_left(self.vocabulary, token)
+                if i < len(self.vocabulary) and self.vocabulary[i] == token:
+                    del self.vocabulary[i]
+
+    def finish_bulk(self):
+        """Sort the tokens appended during a bulk load"""
+        self.vocabulary.sort()
+        self.bulk = False
+
+    def state(self):
+        trigrams = self.trigrams
+        return self.postings, self.vocabulary, trigrams.grams, trigrams.sizes, trigrams.refs
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.postings, index.vocabulary = state[0], state[1]
+        index.trigrams.grams, index.trigrams.sizes, index.trigrams.refs = state[2:]
+        return index
+
+    def _prefix_scores(self, prefix):
+        """Merge the postings of every token starting with prefix"""
+        scores = {}
+        vocabulary = sorted(self.vocabulary) if self.bulk else self.vocabulary
+        i = bisect.bisect_left(vocabulary, prefix)
+        while i < len(vocabulary) and vocabulary[i].startswith(prefix):
+            for book_id, score in self.postings[vocabulary[i]].items():
+                if score > scores.get(book_id, 0):
+                    scores[book_id] = score
+            i += 1
+        return scores
+
+    def search(self, query, prefix=True, limit=None):
+        """Return book ids matching every term, best matches first.
+
+        The last term is treated as a prefix for type-ahead; earlier
+        terms must match whole tokens.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return None
+        term_scores = []
+        for i, term in enumerate(terms):
+            if prefix and i == len(terms) - 1:
+                scores = self._prefix_scores(term)
+            else:
+                scores = self.postings.get(term, {})
+            if not scores:
+                return []
+            term_scores.append(scores)
+
+        term_scores.sort(key=len)
+        candidates = set(term_scores[0])
+        for scores in term_scores[1:]:
+            candidates.intersection_update(scores)
+            if not candidates:
+                return []
+        def rank(book_id):
+            return (-sum(scores[book_id] for scores in term_scores), book_id)
+
+        if limit is not None:
+            return heapq.nsmallest(limit, candidates, key=rank)
+        return sorted(candidates, key=rank)
+
+    def _fuzzy_ids(self, token):
+        # Postings are filled in id order, so this yields ascending ids
+        return (book_id for book_id, score in self.postings[token].items()
+                if score >= FUZZY_MIN_SCORE)
+
+    def fuzzy_search(self, query, threshold=FUZZY_THRESHOLD, limit=None):
+        """Return book ids whose titles and authors approximately match
+
+        Every term must be similar to some title or author token; a book
+        scores the mean of its best similarity per term. Candidates come
+        from the term with the fewest postings, most similar tokens first,
+        and the scan stops once no remaining candidate can reach the top
+        limit.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return None
+        if limit == 0:
+            return []
+        term_matches = [self.trigrams.similar(term, threshold) for term in terms]
+        if not all(term_matches):
+            return []
+        term_matches.sort(key=lambda matches: sum(len(self.postings[token]) for token in matches))
+        rarest = sorted(term_matches[0].items(), key=lambda item: -item[1])
+        others = [sorted(matches.items(), key=lambda item: -item[1]) for matches in term_matches[1:]]
+
+        def best(book_id, ranked):
+            for token, similarity in ranked:
+                if self.postings[token].get(book_id, 0) >= FUZZY_MIN_SCORE:
+                    return similarity
+            return 0
+
+        top = []      # (score, -book id) heap; with a limit, top[0] is the worst kept
+        seen = set()
+        best_others = sum(ranked[0][1] for ranked in others)
+        for similarity, group in itertools.groupby(rarest, key=lambda item: item[1]):
+            # Best score any book reached through this group can get
+            bound = (similarity + best_others) / len(terms)
+            if limit is not None and len(top) >= limit and top[0][0] > bound:
+                break
+            for book_id in heapq.merge(*(self._fuzzy_ids(token) for token, _ in group)):
+                if book_id in seen:
+                    continue
+                seen.add(book_id)
+                total = similarity
+                for ranked in others:
+                    score = best(book_id, ranked)
+                    if not score:
+                        break
+                    total += score
+                else:
+                    entry = (total / len(terms), -book_id)
+                    if limit is None or len(top) < limit:
+                        heapq.heappush(top, entry)
+                    elif entry > top[0]:
+                        heapq.heapreplace(top, entry)
+                if limit is not None and len(top) >= limit and top[0][0] >= bound:
+                    # Later ids in this group can only tie, and lose on id
+                    break
+        return [-book_id for _, book_id in sorted(top, reverse=True)]
+
+
+class Histogram:
+    """Value counts with O(1) updates and cheap access to the most common value
+
+    Ties for the most common value go to the value counted first, as
+    max() over counts gathered in book order chose. top() looks only at
+    the values tied at the highest count, once per change to them.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self._first = {}     # value -> when it was first counted, for ties
+        self._seq = 0
+        self._buckets = {}   # count -> {value: None}, values holding that count
+        self._max = 0
+        self._top = None     # cached top(); None once the highest bucket changes
+
+    def _move(self, value, old, new):
+        if old >= self._max or new >= self._max:
+            self._top = None
+        if old:
+            bucket = self._buckets[old]
+            del bucket[value]
+            if not bucket:
+                del self._buckets[old]
+        else:
+            self._seq += 1
+            self._first[value] = self._seq
+        if new:
+            self.counts[value] = new
+            self._buckets.setdefault(new, {})[value] = None
+        else:
+            del self.counts[value]
+            del self._first[value]
+
+    def add(self, value):
+        count = self.counts.get(value, 0)
+        self._move(value, count, count + 1)
+        if count + 1 > self._max:
+            self._max = count + 1
+
+    def discard(self, value):
+        count = self.counts.get(value, 0)
+        if not count:
+            return
+        self._move(value, count, count - 1)
+        if count == self._max and count not in self._buckets:
+            self._max -= 1
+
+    def top(self):
+        """The value with the highest count, or None when empty"""
+        if not self._max:
+            return None
+        top = self._top
+        if top is None:
+            top = self._top = (min(self._buckets[self._max], key=self._first.__getitem__),)
+        return top[0]
+
+    def most_common(self, n):
+        """Up to n values, highest count first"""
+        values = []
+        for count in sorted(self._buckets, reverse=True):
+            if len(values) >= n:
+                break
+            values.extend(itertools.islice(self._buckets[count], n - len(values)))
+        return values
+
+    def state(self):
+        return self.counts, self._first, self._seq, self._buckets, self._max
+
+    @classmethod
+    def from_state(cls, state):
+        histogram = cls()
+        histogram.counts, histogram._first, histogram._seq, histogram._buckets, histogram._max = state
+        return histogram
+
+
+class LibraryStats:
+    """Genre, status, author and year histograms maintained as deltas"""
+
+    def __init__(self):
+        self.total = 0
+        self.genres = Histogram()
+        self.statuses = Histogram()
+        self.authors = Histogram()
+        self.years = Histogram()
+
+    def add(self, book):
+        self.total += 1
+        if book.genre:
+            self.genres.add(book.genre)
+        self.statuses.add(book.status)
+        self.authors.add(book.author)
+        if book.publication_year:
+            self.years.add(book.publication_year)
+
+    def remove(self, book):
+        self.total -= 1
+        if book.genre:
+            self.genres.discard(book.genre)
+        self.statuses.discard(book.status)
+        self.authors.discard(book.author)
+        if book.publication_year:
+            self.years.discard(book.publication_year)
+
+    def change_status(self, old_status, new_status):
+        self.statuses.discard(old_status)
+        self.statuses.add(new_status)
+
+    def state(self):
+        return (self.total, self.genres.state(), self.statuses.state(),
+                self.authors.state(), self.years.state())
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        stats.total = state[0]
+        stats.genres, stats.statuses, stats.authors, stats.years = map(
+            Histogram.from_state, state[1:])
+        return stats
+
+
+FACET_FIELDS = ("genre", "status", "author", "year")
+FACET_AUTHORS = 20       # authors counted in facets: the most prolific plus any filtered on
+FACET_SORT_RATIO = 8     # selections under 1/8 of the catalog are sorted, larger ones scan a view
+FACET_AUTHOR_CACHE = 256  # author bitmaps kept between requests
+_NONZERO_BYTE = re.compile(b"[^\x00]")
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256))
+
+
+def bitmap_from_ids(ids):
+    """A bitmap (an int with bit i set for book id i) built in one pass"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    table = bytearray((max(ids) >> 3) + 1)
+    for book_id in ids:
+        table[book_id >> 3] |= 1 << (book_id & 7)
+    return int.from_bytes(table, "little")
+
+
+def bitmap_bytes(bitmap):
+    """The bitmap as little-endian bytes, for O(1) membership tests"""
+    return bitmap.to_bytes((bitmap.bit_length() + 7) >> 3, "little")
+
+
+def bitmap_ids(bitmap):
+    """The ids set in a bitmap, ascending"""
+    table = bitmap_bytes(bitmap)
+    ids = []
+    for match in _NONZERO_BYTE.finditer(table):
+        base = match.start() << 3
+        ids.extend(base + bit for bit in _BYTE_BITS[table[match.start()]])
+    return ids
+
+
+class FacetIndex:
+    """Bitmaps per genre, status and year value, and id lists per author
+
+    Filters combine with | within a facet and & across facets, and counts
+    are popcounts. Authors are too many for a dense bitmap each, so they
+    keep ascending id lists; bitmaps are built for the authors that are
+    filtered on or counted and cached until the cache fills up.
+    """
+
+    def __init__(self):
+        self.bitmaps = {"genre": {}, "status": {}, "year": {}}   # field -> value -> bitmap
+        self.authors = {}     # author -> [book ids], ascending
+        self.years = []       # distinct publication years, sorted
+        self.bulk = False
+        self._pending = {}    # (field, value) -> [book ids] added during a bulk load
+        self._author_bitmaps = {}
+
+    @staticmethod
+    def _values(book):
+        yield "status", book.status
+        if book.genre:
+            yield "genre", book.genre
+        if book.publication_year:
+            yield "year", book.publication_year
+
+    def _register(self, field, value):
+        values = self.bitmaps[field]
+        if value not in values:
+            values[value] = 0
+            if field == "year":
+                bisect.insort(self.years, value)
+
+    def _set(self, field, value, bits):
+        self._register(field, value)
+        self.bitmaps[field][value] |= bits
+
+    def _unset(self, field, value, bit):
+        values = self.bitmaps[field]
+        bitmap = values[value] ^ bit
+        if bitmap:
+            values[value] = bitmap
+        else:
+            del values[value]
+            if field == "year":
+                del self.years[bisect.bisect_left(self.years, value)]
+
+    def add(self, book_id, book):
+        for field, value in self._values(book):
+            if self.bulk:
+                # Or-ing into a growing int copies it; bulk loads build each bitmap once
+                self._register(field, value)
+                self._pending.setdefault((field, value), []).append(book_id)
+            else:
+                self._set(field, value, 1 << book_id)
+        # Ids are handed out in increasing order, so appending keeps this sorted
+        self.authors.setdefault(book.author, []).append(book_id)
+        if book.author in self._author_bitmaps:
+            self._author_bitmaps[book.author] |= 1 << book_id
+
+    def remove(self, book_id, book):
+        self._merge_pending()
+        bit = 1 << book_id
+        for field, value in self._values(book):
+            self._unset(field, value, bit)
+        ids = self.authors[book.author]
+        del ids[bisect.bisect_left(ids, book_id)]
+        if not ids:
+            del self.authors[book.author]
+        if book.author in self._author_bitmaps:
+            self._author_bitmaps[book.author] ^= bit
+
+    def change_status(self, book_id, old_status, new_status):
+        self._merge_pending()
+        bit = 1 << book_id
+        self._unset("status", old_status, bit)
+        self._set("status", new_status, bit)
+
+    def _merge_pending(self):
+        for (field, value), ids in self._pending.items():
+            self._set(field, value, bitmap_from_ids(ids))
+        self._pending = {}
+
+    def finish_bulk(self):
+        self._merge_pending()
+        self.bulk = False
+
+    def state(self):
+        return self.bitmaps, self.authors, self.years
+
+    @classmethod
+    def from_state(cls, state):
+        facets = cls()
+        facets.bitmaps, facets.authors, facets.years = state
+        return facets
+
+    def bitmap(self, field, value):
+        """The books holding value in field"""
+        if field == "author":
+            bitmap = self._author_bitmaps.get(value)
+            if bitmap is None:
+                if len(self._author_bitmaps) >= FACET_AUTHOR_CACHE:
+                    self._author_bitmaps.clear()
+                bitmap = self._author_bitmaps[value] = bitmap_from_ids(self.authors.get(value, ()))
+            return bitmap
+        bitmap = self.bitmaps[field].get(value, 0)
+        pending = self._pending.get((field, value))
+        if pending:
+            bitmap |= bitmap_from_ids(pending)
+        return bitmap
+
+    def _year_range(self, low, high):
+        start = 0 if low is None else bisect.bisect_left(self.years, low)
+        stop = len(self.years) if high is None else bisect.bisect_right(self.years, high)
+        return self.years[start:stop]
+
+    def _facet(self, field, wanted):
+        values = self._year_range(*wanted) if field == "year" else wanted
+        bitmap = 0
+        for value in values:
+            bitmap |= self.bitmap(field, value)
+        return bitmap
+
+    def select(self, filters, skip=None):
+        """Books passing every filter but the one on skip
+
+        filters maps genre, status and author to lists of accepted values
+        and year to an inclusive (low, high) range whose ends may be None.
+        """
+        selected = None
+        for field, wanted in filters.items():
+            if field != skip:
+                bitmap = self._facet(field, wanted)
+                selected = bitmap if selected is None else selected & bitmap
+        if selected is None:
+            # Every book has a status
+            return self._facet("status", list(self.bitmaps["status"]))
+        return selected
+
+    def counts(self, filters, authors=()):
+        """Books per facet value under the filters
+
+        Each facet is counted under the other facets' filters only, so
+        the counts show what picking another value of it would match.
+        """
+        facets = {}
+        for field in FACET_FIELDS:
+            selected = self.select(filters, skip=field)
+            if field == "author":
+                values = dict.fromkeys([*authors, *filters.get("author", ())])
+            else:
+                values = self.years if field == "year" else self.bitmaps[field]
+            counts = {}
+            for value in values:
+                count = (self.bitmap(field, value) & selected).bit_count()
+                if count:
+                    counts[value] = count
+            facets[field] = counts
+        return facets
+
+
+STATUS_PERIODS = ("day", "month", "year")
+SERIES_MAX_BUCKETS = 3660    # longest time series a single request may ask for
+
+
+def period_bucket(day, period):
+    """The bucket label of a date: 2026-10-18, 2026-10 or 2026"""
+    return day.isoformat()[:{"day": 10, "month": 7, "year": 4}[period]]
+
+
+def period_buckets(period, start, end):
+    """Labels of every bucket from the one holding start to the one holding end"""
+    if period == "day":
+        return [date.fromordinal(n).isoformat()
+                for n in range(start.toordinal(), end.toordinal() + 1)]
+    if period == "month":
+        return [f"{n // 12:04d}-{n % 12 + 1:02d}"
+                for n in range(start.year * 12 + start.month - 1, end.year * 12 + end.month)]
+    return [f"{year:04d}" for year in range(start.year, end.year + 1)]
+
+
+def creation_events(books, at):
+    """Status events for books created with a status other than the default"""
+    return [(at, book.isbn or book.title, None, book.status)
+            for book in books if book.status != "Available"]
+
+
+class EventLog:
+    """Append-only status transitions with per-day, month and year rollups
+
+    Events are stored column-wise: times and status codes in arrays and
+    book keys in a list. rollups[period][bucket][status] counts the books
+    that moved into status during the bucket, each book once however
+    often it went back and forth, and is updated as each event arrives,
+    so reading analytics never scan the history. A book created with a
+    status has an event from None.
+    """
+
+    def __init__(self):
+        self.times = array.array("q")     # epoch seconds
+        self.books = []                   # ISBN, or the title of books without one
+        self.old = array.array("H")       # indexes into statuses
+        self.new = array.array("H")
+        self.statuses = []
+        self._codes = {}
+        self.rollups = {period: {} for period in STATUS_PERIODS}
+        self.counted = set()              # (period, bucket, status, book) already in rollups
+
+    def __len__(self):
+        return len(self.times)
+
+    def _code(self, status):
+        code = self._codes.get(status)
+        if code is None:
+            code = self._codes[status] = len(self.statuses)
+            self.statuses.append(status)
+        return code
+
+    def add(self, at, book, old_status, new_status):
+        self.times.append(at)
+        self.books.append(book)
+        self.old.append(self._code(old_status))
+        self.new.append(self._code(new_status))
+        day = date.fromtimestamp(at)
+        for period, rollup in self.rollups.items():
+            bucket = period_bucket(day, period)
+            key = (period, bucket, new_status, book)
+            if key in self.counted:
+                continue
+            self.counted.add(key)
+            counts = rollup.setdefault(bucket, {})
+            counts[new_status] = counts.get(new_status, 0) + 1
+
+    def count(self, period, bucket, status):
+        """Books that moved into status during one bucket"""
+        return self.rollups[period].get(bucket, {}).get(status, 0)
+
+    def series(self, period, buckets):
+        """Books that moved into each status, for each bucket"""
+        rollup = self.rollups[period]
+        return [dict(rollup.get(bucket, ())) for bucket in buckets]
+
+    def state(self):
+        return (self.times.tobytes(), self.books, self.old.tobytes(), self.new.tobytes(),
+                self.statuses, self.rollups, self.counted)
+
+    @classmethod
+    def from_state(cls, state):
+        events = cls()
+        times, events.books, old, new, events.statuses, events.rollups, events.counted = state
+        events.times.frombytes(times)
+        events.old.frombytes(old)
+        events.new.frombytes(new)
+        events._codes = {status: code for code, status in enumerate(events.statuses)}
+        return events
+
+
+# Sort keys for the pre-sorted views served by list_books
+SORT_KEYS = {
+    "title": lambda book: (book.title,),
+    "author": lambda book: (book.author,),
+    # Handle None values for publication_year
+    "year": lambda book: (book.publication_year is None, book.publication_year),
+    "date_added": lambda book: (book.date_added,),
+}
+
+
+def encode_cursor(entry):
+    """Turn a sorted-view entry into an opaque pagination cursor"""
+    raw = json.dumps(list(entry), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode())))
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+METRICS_ENABLED = os.environ.get("LIBRARY_METRICS", "1") != "0"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+METRIC_HELP = {
+    "library_operation_seconds": ("histogram", "Time spent in Library operations"),
+    "library_operation_items": ("histogram", "Books returned or touched per Library operation"),
+    "library_storage_seconds": ("histogram", "Time spent saving and loading library files"),
+    "library_bytes_written_total": ("counter", "Bytes written to snapshots, journals and event logs"),
+    "http_request_seconds": ("histogram", "Request latency up to the start of the response"),
+    "http_response_bytes_total": ("counter", "Response body bytes, excluding streamed bodies"),
+    "http_encode_seconds": ("histogram", "Time spent encoding JSON responses"),
+    "http_slow_requests_total": ("counter", "Requests slower than LIBRARY_PROFILE_SLOW_MS"),
+    "http_profiles_written_total": ("counter", "cProfile dumps written for slow requests"),
+    "library_books": ("gauge", "Books in the default library"),
+    "library_pool_loaded": ("gauge", "Named libraries currently loaded"),
+    "response_cache_entries": ("gauge", "Encoded responses held by the cache"),
+    "response_cache_bytes": ("gauge", "Bytes of encoded responses held by the cache"),
+    "response_cache_requests_total": ("counter", "Response cache lookups by result"),
+}
+
+
+class Metrics:
+    """Counters, gauges and fixed-bucket histograms in Prometheus text format
+
+    Series are keyed on (name, sorted label pairs); recording one costs a
+    dict lookup and a bisect under a single lock.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._values = {}       # (name, labels) -> counter or gauge value
+        self._histograms = {}   # (name, labels) -> [bucket counts, sum, count, buckets]
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [[0] * (len(buckets) + 1), 0, 0, buckets]
+            series[0][bisect.bisect_left(buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def timed(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _labels(pairs, extra=()):
+        pairs = tuple(pairs) + tuple(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                   for _, value in pairs)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        """Return every series in the Prometheus text exposition format"""
+        with self._lock:
+            values = sorted(self._values.items())
+            histograms = sorted((key, (list(series[0]),) + tuple(series[1:]))
+                                for key, series in self._histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, text = METRIC_HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in values:
+            describe(name)
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def instrumented(op, count=len):
+    """Record a Library method's latency, and how many books it returned"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            metrics.observe("library_operation_seconds", time.perf_counter() - start, op=op)
+            if count is not None:
+                metrics.observe("library_operation_items", count(result), COUNT_BUCKETS, op=op)
+            return result
+        return wrapper
+    return decorator
+
+
+# Storage backends: "json" keeps the catalog in memory and persists it to a
+# JSON file, "sqlite" keeps it in an indexed database and queries it there.
+STORAGE_BACKEND = os.environ.get("LIBRARY_STORAGE", "json")
+DATA_DIR = os.environ.get("LIBRARY_DATA_DIR", "")   # where library files live
+# Persistence modes: "snapshot" rewrites the whole JSON file on every change,
+# "background" does the same rewrite on a writer thread that coalesces
+# bursts of changes, and "journal" appends one record per change and
+# compacts in the background. "shared" is the journal for several worker
+# processes serving one library: writes take a file lock and first replay
+# what other processes appended, and reads replay it when the files change.
+PERSISTENCE_MODE = os.environ.get("LIBRARY_PERSISTENCE", "snapshot")
+COMPACT_INTERVAL = 30        # seconds between background compaction checks
+COMPACT_THRESHOLD = 1000     # journal records that trigger a compaction
+
+
+def _fsync_dir(path):
+    """Flush a directory entry so a rename survives a crash (POSIX only)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class ReadWriteLock:
+    """Many concurrent readers or a single writer; waiting writers go first
+
+    The thread holding the write lock may re-enter write() and read().
+    Readers must not nest read() calls.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+        self._waiting_writers = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        me = threading.get_ident()
+        with self._cond:
+            nested = self._writer == me
+            if nested:
+                self._depth += 1
+            else:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                if nested:
+                    self._depth -= 1
+                else:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1
+            else:
+                self._waiting_writers += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+                self._writer = me
+                self._depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+# "indent" keeps the human-readable file layout, "compact" drops whitespace
+JSON_FORMAT = os.environ.get("LIBRARY_JSON_FORMAT", "indent")
+LAZY_LOAD = os.environ.get("LIBRARY_LAZY_LOAD", "") == "1"
+# A binary snapshot of the loaded library and its indexes, kept next to the
+# JSON file and used at startup while the JSON is unchanged
+SNAPSHOT_CACHE = os.environ.get("LIBRARY_SNAPSHOT_CACHE", "1") != "0"
+SNAPSHOT_FORMAT = 5
+SNAPSHOT_MAGIC = b"LIBSNAP\0"   # then an 8-byte header length, the header and the state
+READ_CHUNK = 1 << 16     # characters read from the snapshot at a time
+LOAD_BATCH = 1000        # books inserted per lock acquisition while loading
+_DECODER = json.JSONDecoder()
+
+
+class _JSONStream:
+    """Pulls JSON values out of a file without reading it all at once"""
+
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(READ_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """The next non-whitespace character, or "" at end of file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r}")
+        self.pos += 1
+
+    def skip(self, char):
+        """Consume char if it is next; return whether it was"""
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_library_file(file, header):
+    """Yield the book dicts of a library file one at a time
+
+    Every other top-level field is stored into header as it is met.
+    """
+    stream = _JSONStream(file)
+    stream.expect("{")
+    if stream.skip("}"):
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "books":
+            stream.expect("[")
+            if not stream.skip("]"):
+                while True:
+                    yield stream.value()
+                    if not stream.skip(","):
+                        stream.expect("]")
+                        break
+        else:
+            header[key] = stream.value()
+        if not stream.skip(","):
+            stream.expect("}")
+            return
+
+
+def _flat_json(record, separator, item_separator):
+    """json.dumps of a dict of plain values, without the pure-Python indent encoder"""
+    if not record or not all(type(value) in _FLAT_TYPES for value in record.values()):
+        return None
+    return item_separator.join(_encode_string(key) + separator + _json_value(value)
+                               for key, value in record.items())
+
+
+_FLAT_TYPES = (str, int, float, bool, type(None))
+
+
+def write_library_file(file, header, books, compact=False):
+    """Write header fields and then the books (as dicts) one at a time
+
+    The indented layout is byte-for-byte what json.dump(..., indent=4)
+    produces for the same data.
+    """
+    if compact:
+        file.write("{")
+        for key, value in header.items():
+            file.write(json.dumps(key) + ":" + json.dumps(value, separators=(",", ":")) + ",")
+        file.write('"books":[')
+        first = True
+        for book in books:
+            if not first:
+                file.write(",")
+            flat = _flat_json(book, ":", ",")
+            file.write("{" + flat + "}" if flat is not None
+                       else json.dumps(book, separators=(",", ":")))
+            first = False
+        file.write("]}")
+        return
+
+    file.write("{\n")
+    for key, value in header.items():
+        file.write("    " + json.dumps(key) + ": " + json.dumps(value) + ",\n")
+    file.write('    "books": [')
+    first = True
+    for book in books:
+        file.write("\n        " if first else ",\n        ")
+        flat = _flat_json(book, ": ", ",\n            ")
+        file.write("{\n            " + flat + "\n        }" if flat is not None
+                   else json.dumps(book, indent=4).replace("\n", "\n        "))
+        first = False
+    file.write("]\n}" if first else "\n    ]\n}")
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class JSONStorage:
+    """Persists an in-memory library as a JSON snapshot plus optional journal"""
+
+    queryable = False
+
+    def __init__(self, file_path, persistence=None, compact=None, cache=None):
+        self.file_path = file_path
+        self.journal_path = file_path + ".journal"
+        self.cache_path = file_path + ".snap"
+        self.lock_path = file_path + ".lock"
+        self.events_path = file_path + ".events"
+        self.cache = SNAPSHOT_CACHE if cache is None else cache
+        self.persistence = persistence or PERSISTENCE_MODE
+        if self.persistence == "shared" and fcntl is None:
+            print("Shared persistence needs fcntl; using the journal instead")
+            self.persistence = "journal"
+        self.shared = self.persistence == "shared"
+        self.journaled = self.persistence in ("journal", "shared")
+        self.compact_format = JSON_FORMAT == "compact" if compact is None else compact
+        self.journal_seq = 0
+        self.journal_records = 0
+        self._journal = None
+        self._compactor = None
+        # Held only around writing the files, never while taking the
+        # library's lock, so it is always the innermost lock
+        self._save_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._written_version = 0    # library version the JSON file holds
+        self._file_journal_seq = 0   # journal_seq in the JSON file's header
+        self._unreadable = False     # the file failed to load, so it is never saved over
+        self._writer = None
+        self._pending = threading.Condition()
+        self._requested = 0    # generation of the latest change to save
+        self._saved = 0        # generation the file on disk reflects
+        self._save_failed = False
+        self._closed = threading.Event()
+        self._lock_file = None
+        self._lock_pid = None
+        self._lock_depth = 0
+        self._stamp = None           # _disk_stamp() as of the last catch-up
+        self._journal_offset = 0     # journal bytes this process has applied or written
+        self._events = None
+        self._events_offset = 0      # likewise for the status event log
+
+    def open(self, library, lazy=False):
+        """Load the library and start any background work for the mode
+
+        With lazy set the load runs on a background thread and requests
+        are served from the books loaded so far. Shared libraries always
+        load up front, under the file lock.
+        """
+        if lazy and not self.shared:
+            loader = threading.Thread(target=self._open, args=(library,),
+                                      name="library-loader", daemon=True)
+            loader.start()
+            return True
+        return self._open(library)
+
+    def _open(self, library):
+        try:
+            if self.shared:
+                with library._lock.write(), self._file_lock(exclusive=False):
+                    loaded = self.load(library)
+                    self._stamp = self._disk_stamp()
+            else:
+                loaded = self.load(library)
+        finally:
+            library._loaded.set()
+        if self.journaled:
+            self._start_compactor(library)
+        return loaded
+
+    @contextlib.contextmanager
+    def _file_lock(self, exclusive):
+        """flock the library's lock file against other processes
+
+        Callers hold the library's write lock, which keeps the other
+        threads of this process out; nested use keeps the outer lock.
+        """
+        if self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        if self._lock_pid != os.getpid():
+            # A forked worker must not share its parent's open file, or the
+            # lock would not exclude the parent
+            self._lock_file = open(self.lock_path, 'a')
+            self._lock_pid = os.getpid()
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self._lock_depth = 1
+        try:
+            yield
+        finally:
+            self._lock_depth = 0
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _disk_stamp(self):
+        """inode, mtime and size of the snapshot and the journal"""
+        stamp = []
+        for path in (self.file_path, self.journal_path):
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    @contextlib.contextmanager
+    def transaction(self, library):
+        """Keep other processes out while a change is applied and recorded
+
+        The library's write lock must be held. Changes other processes
+        made are replayed first, so identifiers resolve against the
+        latest catalog and journal records stay in one order.
+        """
+        if not self.shared:
+            yield
+            return
+        with self._file_lock(exclusive=True):
+            self._catch_up(library)
+            # Cut off torn records left by a process that died mid-append
+            for path, offset in ((self.journal_path, self._journal_offset),
+                                 (self.events_path, self._events_offset)):
+                if os.path.exists(path) and os.path.getsize(path) > offset:
+                    os.truncate(path, offset)
+            yield
+            self._stamp = self._disk_stamp()
+
+    def refresh(self, library):
+        """Replay changes other processes made since the last look
+
+        Costs two stat calls when nothing changed.
+        """
+        if not self.shared or self._stamp == self._disk_stamp():
+            return False
+        with library._lock.write(), self._file_lock(exclusive=False):
+            return self._catch_up(library)
+
+    def _catch_up(self, library):
+        stamp = self._disk_stamp()
+        if stamp == self._stamp:
+            return False
+        snapshot, journal = stamp
+        seen_snapshot, seen_journal = self._stamp or (None, None)
+        if snapshot != seen_snapshot and self._snapshot_seq() != self.journal_seq:
+            # Another process compacted past records this one has not seen
+            self._close_journal()
+            self.journal_records = 0
+            self.load(library)
+        else:
+            if (snapshot != seen_snapshot or journal is None or seen_journal is None
+                    or journal[0] != seen_journal[0]):
+                # The journal may have been compacted away and started again;
+                # records already applied are skipped by their seq
+                self._close_journal()
+                self._journal_offset = 0
+                self.journal_records = 0
+            if journal is not None:
+                self._replay_journal(library)
+            self._replay_events(library)
+        self._stamp = self._disk_stamp()
+        return True
+
+    def _snapshot_seq(self):
+        """The journal_seq recorded in the snapshot's header"""
+        header = {}
+        try:
+            with open(self.file_path, 'r') as file:
+                for _ in iter_library_file(file, header):
+                    break
+        except (OSError, ValueError) as e:
+            print(f"Error reading library header: {e}")
+        return header.get("journal_seq", 0)
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def record_events(self, events):
+        """Append status transitions (time, book, old, new) to the event log with one fsync"""
+        if not events:
+            return True
+        try:
+            if self._events is None:
+                self._events = open(self.events_path, 'a')
+            lines = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events)
+            self._events.write(lines)
+            self._events.flush()
+            os.fsync(self._events.fileno())
+            self._events_offset += len(lines.encode())
+            metrics.inc("library_bytes_written_total", len(lines.encode()), kind="events")
+            return True
+        except Exception as e:
+            print(f"Error writing status event: {e}")
+            return False
+
+    def record(self, library, record):
+        """Write a mutation to disk according to the persistence mode"""
+        if self.persistence == "background":
+            self._schedule_save(library)
+            return True
+        if not self.journaled:
+            return self.save(library)
+        try:
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'a')
+            self.journal_seq += 1
+            record["seq"] = self.journal_seq
+            line = json.dumps(record, separators=(",", ":")) + "\n"
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self.journal_records += 1
+            self._journal_offset += len(line.encode())
+            metrics.inc("library_bytes_written_total", len(line.encode()), kind="journal")
+            return True
+        except Exception as e:
+            print(f"Error writing journal: {e}")
+            return False
+
+    def _schedule_save(self, library):
+        """Ask the writer thread for a snapshot; bursts collapse into one write"""
+        with self._pending:
+            self._requested += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, args=(library,),
+                                                name="library-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+            self._pending.notify_all()
+
+    def _write_loop(self, library):
+        while True:
+            with self._pending:
+                while self._saved >= self._requested:
+                    if self._closed.is_set():
+                        return
+                    self._pending.wait()
+                target = self._requested
+            saved = self.save(library)
+            with self._pending:
+                self._saved = target
+                self._save_failed = not saved
+                self._pending.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every change made so far has reached the disk
+
+        False if that took longer than timeout or the write failed.
+        """
+        with self._pending:
+            target = self._requested
+            return (self._pending.wait_for(lambda: self._saved >= target, timeout)
+                    and not self._save_failed)
+
+    def close(self, library):
+        """Write out pending changes and stop the background threads"""
+        if self._closed.is_set():
+            return
+        self.flush()
+        self.write_cache(library)
+        self._closed.set()
+        with self._pending:
+            self._pending.notify_all()
+        if self._writer is not None:
+            atexit.unregister(self.flush)
+        with library._lock.write():
+            self._close_journal()
+            if self._events is not None:
+                self._events.close()
+                self._events = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = self._lock_pid = None
+
+    def compact(self, library):
+        """Fold the journal into a fresh snapshot and drop the records it covers
+
+        Writers are held up only while the catalog is copied and while the
+        journal is cut; the snapshot is written outside the library lock.
+        Shared libraries compact under the file lock instead, since other
+        processes append to the journal too. The binary snapshot is left
+        to close(): marshalling a large catalog holds up writers for seconds.
+        """
+        with self._compact_lock:
+            if self.shared:
+                with library._lock.write(), self.transaction(library):
+                    if not self.journal_records:
+                        return True    # another process compacted first
+                    if not self._save(library):
+                        return False
+                    self._cut_journal(self._journal_offset, self.journal_records)
+            else:
+                with library._lock.read():
+                    offset, records = self._journal_offset, self.journal_records
+                    if not records:
+                        return True
+                    copy = self._copy(library)
+                if not self._write_snapshot(*copy):
+                    return False
+                with library._lock.write():
+                    self._cut_journal(offset, records)
+            return True
+
+    def _cut_journal(self, offset, records):
+        """Drop the first offset bytes (records records) of the journal
+
+        Records appended since are kept; replay skips any a snapshot holds.
+        """
+        self._close_journal()
+        try:
+            with open(self.journal_path, 'rb') as journal:
+                journal.seek(offset)
+                tail = journal.read()
+            if tail:
+                tmp_path = self.journal_path + ".tmp"
+                with open(tmp_path, 'wb') as journal:
+                    journal.write(tail)
+                    journal.flush()
+                    os.fsync(journal.fileno())
+                os.replace(tmp_path, self.journal_path)
+                _fsync_dir(self.journal_path)
+            else:
+                os.remove(self.journal_path)
+        except OSError as e:
+            print(f"Error truncating journal: {e}")
+            return
+        self.journal_records -= records
+        self._journal_offset -= offset
+
+    def _start_compactor(self, library):
+        """Start a daemon thread that compacts the journal periodically"""
+        def run():
+            last = time.monotonic()
+            while not self._closed.wait(1):
+                due = time.monotonic() - last >= COMPACT_INTERVAL
+                if self.journal_records >= COMPACT_THRESHOLD or (due and self.journal_records):
+                    self.compact(library)
+                if due:
+                    last = time.monotonic()
+
+        self._compactor = threading.Thread(target=run, name="library-compactor", daemon=True)
+        self._compactor.start()
+
+    def save(self, library):
+        """Atomically write the whole library to the JSON snapshot"""
+        if self.shared:
+            with library._lock.write(), self.transaction(library):
+                return self._save(library)
+        return self._save(library)
+
+    def _save(self, library):
+        # Copy the catalog, then encode and write it without holding up
+        # writers
+        with library._lock.read():
+            copy = self._copy(library)
+        return self._write_snapshot(*copy)
+
+    def _copy(self, library):
+        """The library version, file header and book records; call under the library lock"""
+        header = {"name": library.name, "journal_seq": self.journal_seq}
+        with _gc_paused():
+            # A full collection per copy would scan every index too
+            return library.version, header, [book.to_dict() for book in library.books]
+
+    def _write_snapshot(self, version, header, books):
+        tmp_path = self.file_path + ".tmp"
+        try:
+            with self._save_lock:
+                if self._unreadable:
+                    print(f"Not saving over {self.file_path}: it failed to load")
+                    return False
+                if version < self._written_version:
+                    return True    # a later copy already reached the disk
+                start = time.perf_counter()
+                with open(tmp_path, 'w') as file:
+                    write_library_file(file, header, books, self.compact_format)
+                    file.flush()
+                    os.fsync(file.fileno())
+                    written = os.fstat(file.fileno()).st_size
+                os.replace(tmp_path, self.file_path)
+                _fsync_dir(self.file_path)
+                self._written_version = version
+                self._file_journal_seq = header["journal_seq"]
+            metrics.observe("library_storage_seconds", time.perf_counter() - start, op="save")
+            metrics.inc("library_bytes_written_total", written, kind="snapshot")
+            return True
+        except Exception as e:
+            print(f"Error saving library: {e}")
+            return False
+
+    def _source_signature(self):
+        """mtime, size and content hash of the JSON file"""
+        stat = os.stat(self.file_path)
+        digest = hashlib.blake2b(digest_size=16)
+        with open(self.file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": digest.hexdigest()}
+
+    def _cache_header(self):
+        return {"format": SNAPSHOT_FORMAT, "marshal": marshal.version,
+                "python": list(sys.version_info[:2])}
+
+    def write_cache(self, library):
+        """Write the binary snapshot of the library as it stands on disk
+
+        Skipped while a save is pending, since the JSON then lags behind
+        memory and the snapshot would not match it.
+        """
+        if not self.cache or not os.path.exists(self.file_path):
+            return False
+        if self.shared:
+            # Another process may replace the JSON between hashing it and
+            # capturing the catalog
+            with library._lock.write(), self._file_lock(exclusive=False):
+                self._catch_up(library)
+                return self._write_cache(library)
+        return self._write_cache(library)
+
+    def _write_cache(self, library):
+        # Unique per writer: other libraries in this process may write the same cache
+        tmp_path = f"{self.cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with library._lock.read():
+                version = library.version
+                header = dict(self._cache_header(), name=library.name,
+                              journal_seq=self.journal_seq, events_offset=self._events_offset)
+                state = marshal.dumps(library._state())
+            # Saves replace the JSON under _save_lock, so it can be hashed
+            # there without holding up writers
+            with self._save_lock:
+                if self.journaled:
+                    # The journal must still hold every record between the
+                    # file and the captured catalog
+                    current = self._file_journal_seq <= header["journal_seq"]
+                else:
+                    current = self._written_version == version
+                if not current:
+                    return False
+                header["source"] = self._source_signature()
+                header = marshal.dumps(header)
+                with open(tmp_path, 'wb') as file:
+                    file.write(SNAPSHOT_MAGIC + len(header).to_bytes(8, "little") + header)
+                    file.write(state)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, self.cache_path)
+            return True
+        except Exception as e:
+            print(f"Error writing snapshot cache: {e}")
+            return False
+
+    def _load_cache(self, library):
+        """Restore the library from the binary snapshot if it matches the JSON"""
+        if not self.cache or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, 'rb') as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if mapped[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                    raise ValueError("not a library snapshot")
+                start = len(SNAPSHOT_MAGIC) + 8
+                body = start + int.from_bytes(mapped[len(SNAPSHOT_MAGIC):start], "little")
+                header = marshal.loads(mapped[start:body])
+                expected = self._cache_header()
+                if any(header.get(key) != value for key, value in expected.items()):
+                    return False
+                stat = os.stat(self.file_path)
+                source = header["source"]
+                if (source["mtime_ns"], source["size"]) != (stat.st_mtime_ns, stat.st_size):
+                    return False
+                if source != self._source_signature():
+                    return False
+                # Millions of new containers would otherwise trigger repeated
+                # collections that find nothing to free
+                with _gc_paused(), memoryview(mapped) as view, view[body:] as state_bytes:
+                    state = marshal.loads(state_bytes)
+                    with library._lock.write():
+                        library._restore(state)
+            library.name = header["name"]
+            self.journal_seq = header["journal_seq"]
+            self._events_offset = header["events_offset"]
+            return True
+        except (OSError, EOFError, ValueError, TypeError, KeyError) as e:
+            print(f"Ignoring snapshot cache: {e}")
+            with library._lock.write():
+                library._clear()
+            return False
+
+    def load(self, library):
+        """Load the library and replay the journal on top of it
+
+        The binary snapshot is used when it matches the JSON file;
+        otherwise the JSON is parsed and the snapshot rewritten in the
+        background for the next start.
+        """
+        with metrics.timed("library_storage_seconds", op="load"):
+            return self._load(library)
+
+    def _load(self, library):
+        exists = os.path.exists(self.file_path)
+        from_cache = loaded = exists and self._load_cache(library)
+        if exists and not from_cache:
+            try:
+                header = {}
+                with library._lock.write():
+                    library._clear()
+                    library._begin_bulk()
+                with open(self.file_path, 'r') as file:
+                    batch = []
+                    for book_data in iter_library_file(file, header):
+                        batch.append(Book.from_dict(book_data))
+                        if len(batch) >= LOAD_BATCH:
+                            self._add_batch(library, batch)
+                            batch = []
+                    self._add_batch(library, batch)
+                with library._lock.write():
+                    library._end_bulk()
+                library.name = header.get("name", library.name)
+                self.journal_seq = header.get("journal_seq", 0)
+                loaded = True
+            except Exception as e:
+                print(f"Error loading library: {e}")
+                with library._lock.write():
+                    library._clear()
+                self._unreadable = True
+                return False
+
+        self._unreadable = False
+        if loaded:
+            # The catalog in memory is now exactly the JSON file
+            self._written_version = library.version
+            self._file_journal_seq = self.journal_seq
+        self._journal_offset = 0
+        if os.path.exists(self.journal_path):
+            try:
+                self._replay_journal(library)
+                if not self.shared and self._journal_offset < os.path.getsize(self.journal_path):
+                    os.truncate(self.journal_path, self._journal_offset)
+                loaded = True
+            except Exception as e:
+                print(f"Error replaying journal: {e}")
+        if not from_cache:
+            self._events_offset = 0
+        try:
+            self._replay_events(library)
+            if not self.shared and os.path.exists(self.events_path) and \
+                    self._events_offset < os.path.getsize(self.events_path):
+                os.truncate(self.events_path, self._events_offset)
+        except Exception as e:
+            print(f"Error reading status events: {e}")
+        if loaded and self.cache and not from_cache:
+            threading.Thread(target=self.write_cache, args=(library,),
+                             name="library-snapshot", daemon=True).start()
+        return loaded
+
+    def _replay_journal(self, library):
+        """Apply journal records from _journal_offset on, up to a torn final line"""
+        with open(self.journal_path, 'rb') as journal:
+            journal.seek(self._journal_offset)
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self._journal_offset += len(line)
+                if record.get("seq", 0) <= self.journal_seq:
+                    continue
+                with library._lock.write():
+                    library._apply_record(record)
+                self.journal_seq = record["seq"]
+                self.journal_records += 1
+
+    def _replay_events(self, library):
+        """Add status events from _events_offset on to the library's event log"""
+        if not os.path.exists(self.events_path):
+            return
+        with open(self.events_path, 'rb') as events:
+            events.seek(self._events_offset)
+            for line in events:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self._events_offset += len(line)
+                with library._lock.write():
+                    library._events.add(*event)
+
+    @staticmethod
+    def _add_batch(library, books):
+        # Readers may run between batches while a lazy load is in progress
+        with library._lock.write():
+            for book in books:
+                library._apply_add(book)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT,
+    title_lower TEXT,
+    author TEXT,
+    isbn TEXT,
+    genre TEXT,
+    publication_year INTEGER,
+    status TEXT,
+    notes TEXT,
+    date_added TEXT
+);
+CREATE INDEX IF NOT EXISTS books_title_lower ON books(title_lower);
+CREATE INDEX IF NOT EXISTS books_title ON books(title);
+CREATE INDEX IF NOT EXISTS books_isbn ON books(isbn);
+CREATE INDEX IF NOT EXISTS books_author ON books(author);
+CREATE INDEX IF NOT EXISTS books_genre ON books(genre);
+CREATE INDEX IF NOT EXISTS books_status ON books(status);
+CREATE INDEX IF NOT EXISTS books_year ON books(publication_year);
+CREATE INDEX IF NOT EXISTS books_date_added ON books(date_added);
+CREATE TABLE IF NOT EXISTS status_events (
+    id INTEGER PRIMARY KEY,
+    at INTEGER,
+    book TEXT,
+    old_status TEXT,
+    new_status TEXT
+);
+CREATE TABLE IF NOT EXISTS status_rollups (
+    period TEXT,
+    bucket TEXT,
+    status TEXT,
+    count INTEGER,
+    PRIMARY KEY (period, bucket, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS status_rollup_books (
+    period TEXT,
+    bucket TEXT,
+    status TEXT,
+    book TEXT,
+    PRIMARY KEY (period, bucket, status, book)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, author, genre, isbn, content='books', content_rowid='id'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS books_vocab USING fts5vocab(books_fts, 'col');
+CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts(rowid, title, author, genre, isbn)
+    VALUES (new.id, new.title, new.author, new.genre, new.isbn);
+END;
+CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author, genre, isbn)
+    VALUES ('delete', old.id, old.title, old.author, old.genre, old.isbn);
+END;
+CREATE TRIGGER IF NOT EXISTS books_fts_update
+AFTER UPDATE OF title, author, genre, isbn ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author, genre, isbn)
+    VALUES ('delete', old.id, old.title, old.author, old.genre, old.isbn);
+    INSERT INTO books_fts(rowid, title, author, genre, isbn)
+    VALUES (new.id, new.title, new.author, new.genre, new.isbn);
+END;
+"""
+
+BOOK_COLUMNS = ("title", "author", "isbn", "genre", "publication_year",
+                "status", "notes", "date_added")
+_SELECT_BOOK = "SELECT id, " + ", ".join(BOOK_COLUMNS) + " FROM books"
+
+# SQL equivalents of SORT_KEYS; every ORDER BY ends with the id tiebreak
+SQL_SORT_KEYS = {
+    "title": ("title",),
+    "author": ("author",),
+    "year": ("publication_year IS NULL", "IFNULL(publication_year, 0)"),
+    "date_added": ("date_added",),
+}
+
+
+class SQLiteStorage:
+    """Keeps the catalog in SQLite and pushes queries down into SQL
+
+    Nothing is held in memory, so startup time and memory use do not
+    grow with the catalog.
+    """
+
+    queryable = True
+
+    def __init__(self, file_path, import_path=None):
+        self.file_path = file_path
+        self.import_path = import_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(file_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SQLITE_SCHEMA)
+        self._trigrams = None    # vocabulary for fuzzy search, loaded lazily
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def open(self, library, lazy=False):
+        """Read the library name, importing a JSON library on first use"""
+        library._loaded.set()
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'name'").fetchone()
+            empty = self._conn.execute("SELECT 1 FROM books LIMIT 1").fetchone() is None
+        if row:
+            library.name = row[0]
+        if empty and self.import_path and os.path.exists(self.import_path):
+            return self._import_json(library)
+        return row is not None
+
+    def _import_json(self, library):
+        try:
+            with open(self.import_path, 'r') as file:
+                data = json.load(file)
+        except Exception as e:
+            print(f"Error importing library: {e}")
+            return False
+        library.name = data.get("name", library.name)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO books (title_lower, " + ", ".join(BOOK_COLUMNS) + ") "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._row(Book.from_dict(book_data)) for book_data in data.get("books", [])))
+        self.save(library)
+        return True
+
+    @staticmethod
+    def _row(book):
+        return ((book.title or "").lower(),) + tuple(getattr(book, column) for column in BOOK_COLUMNS)
+
+    @staticmethod
+    def _book(row):
+        book = Book(*row[1:8])
+        book.date_added = row[8]
+        return book
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def save(self, library):
+        """Record the library name; book rows are committed as they change"""
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('name', ?)",
+                                   (library.name,))
+            return True
+        except Exception as e:
+            print(f"Error saving library: {e}")
+            return False
+
+    def load(self, library):
+        return self.open(library)
+
+    def flush(self, timeout=None):
+        """Every change is committed as it happens"""
+        return True
+
+    def refresh(self, library):
+        """Notice commits from other connections through PRAGMA data_version"""
+        version = self._query("PRAGMA data_version")[0][0]
+        if version == self._data_version:
+            return False
+        self._data_version = version
+        self._trigrams = None    # other processes may have added terms
+        library._bump()
+        return True
+
+    def close(self, library):
+        with self._lock:
+            self._conn.close()
+
+    def compact(self, library):
+        """Checkpoint the write-ahead log back into the database file"""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True
+
+    def iter_books(self):
+        """All books in insertion order, fetched a batch at a time"""
+        last_id = 0
+        while True:
+            rows = self._query(_SELECT_BOOK + " WHERE id > ? ORDER BY id LIMIT ?",
+                               (last_id, EXPORT_BATCH))
+            for row in rows:
+                yield self._book(row)
+            if len(rows) < EXPORT_BATCH:
+                return
+            last_id = rows[-1][0]
+
+    def _find(self, book_identifier):
+        rows = self._query(_SELECT_BOOK + " WHERE title_lower = ? OR isbn = ? ORDER BY id LIMIT 1",
+                           (book_identifier.lower(), book_identifier))
+        return rows[0] if rows else None
+
+    def add_book(self, book):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO books (title_lower, " + ", ".join(BOOK_COLUMNS) + ") "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", self._row(book))
+            self._record_events(creation_events([book], int(time.time())))
+        self._learn([book])
+        return book.to_dict()
+
+    def add_books(self, books):
+        """Insert a batch of books in a single transaction"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO books (title_lower, " + ", ".join(BOOK_COLUMNS) + ") "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [self._row(book) for book in books])
+            self._record_events(creation_events(books, int(time.time())))
+        self._learn(books)
+
+    def _learn(self, books):
+        # Removed books leave their tokens behind; those simply match nothing
+        if self._trigrams is not None:
+            for book in books:
+                for token in tokenize(book.title) + tokenize(book.author):
+                    self._trigrams.add(token)
+
+    def remove_book(self, book_identifier):
+        row = self._find(book_identifier)
+        if row is None:
+            return None
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM books WHERE id = ?", (row[0],))
+        return self._book(row).to_dict()
+
+    def update_book_status(self, book_identifier, new_status):
+        row = self._find(book_identifier)
+        if row is None:
+            return None
+        book = self._book(row)
+        at = int(time.time())
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE books SET status = ? WHERE id = ?", (new_status, row[0]))
+            if new_status != book.status:
+                self._record_events([(at, book.isbn or book.title, book.status, new_status)])
+        book.status = new_status
+        return book.to_dict()
+
+    def _record_events(self, events):
+        """Log status events and count each book once per rollup bucket; call in a transaction"""
+        for at, book, old_status, new_status in events:
+            self._conn.execute(
+                "INSERT INTO status_events (at, book, old_status, new_status)"
+                " VALUES (?, ?, ?, ?)", (at, book, old_status, new_status))
+            day = date.fromtimestamp(at)
+            for period in STATUS_PERIODS:
+                bucket = period_bucket(day, period)
+                if self._conn.execute("INSERT OR IGNORE INTO status_rollup_books VALUES (?, ?, ?, ?)",
+                                      (period, bucket, new_status, book)).rowcount:
+                    self._conn.execute(
+                        "INSERT INTO status_rollups VALUES (?, ?, ?, 1) ON CONFLICT"
+                        " (period, bucket, status) DO UPDATE SET count = count + 1",
+                        (period, bucket, new_status))
+
+    def _rollup(self, period, bucket, status):
+        rows = self._query("SELECT count FROM status_rollups"
+                           " WHERE period = ? AND bucket = ? AND status = ?",
+                           (period, bucket, status))
+        return rows[0][0] if rows else 0
+
+    def status_series(self, period, buckets):
+        counts = {bucket: {} for bucket in buckets}
+        if buckets:
+            rows = self._query("SELECT bucket, status, count FROM status_rollups"
+                               " WHERE period = ? AND bucket BETWEEN ? AND ?",
+                               (period, buckets[0], buckets[-1]))
+            for bucket, status, count in rows:
+                counts[bucket][status] = count
+        return list(counts.values())
+
+    def search_books(self, query, mode=None, limit=None, threshold=None, as_books=False):
+        mode = mode or SEARCH_MODE
+        terms = tokenize(query)
+        if mode == "fuzzy" and terms:
+            return self._fuzzy_search(terms, limit, threshold, as_books)
+        if mode == "substring" or not terms:
+            sql = (_SELECT_BOOK + " WHERE instr(lower(title), :q) OR instr(lower(author), :q)"
+                   " OR instr(lower(genre), :q) OR instr(isbn, :q) ORDER BY id")
+            params = {"q": query.lower()}
+        else:
+            # Quote every term; the last one is a prefix for type-ahead
+            match = " ".join('"%s"' % term for term in terms) + "*"
+            weights = ", ".join(str(float(weight)) for weight in FIELD_WEIGHTS.values())
+            sql = (_SELECT_BOOK + " JOIN (SELECT rowid, bm25(books_fts, %s) AS rank"
+                   " FROM books_fts WHERE books_fts MATCH :match) AS hits"
+                   " ON hits.rowid = books.id ORDER BY hits.rank, books.id" % weights)
+            params = {"match": match}
+        if limit is not None:
+            sql += " LIMIT %d" % max(int(limit), 0)
+        return book_output((self._book(row) for row in self._query(sql, params)), as_books)
+
+    def _vocabulary(self):
+        """Trigram index over the full-text vocabulary, built on first use"""
+        if self._trigrams is None:
+            trigrams = TrigramIndex()
+            for (term,) in self._query("SELECT DISTINCT term FROM books_vocab"
+                                       " WHERE col IN ('title', 'author')"):
+                trigrams.add(term)
+            self._trigrams = trigrams
+        return self._trigrams
+
+    def _fuzzy_search(self, terms, limit, threshold, as_books=False):
+        trigrams = self._vocabulary()
+        term_matches = [trigrams.similar(term, FUZZY_THRESHOLD if threshold is None else threshold)
+                        for term in terms]
+        if not all(term_matches):
+            return []
+        # Each term must match one of its similar tokens; fuzzy_rank scores the rows
+        match = " AND ".join("(" + " OR ".join('"%s"' % token for token in matches) + ")"
+                             for matches in term_matches)
+        rows = self._query(_SELECT_BOOK + " WHERE id IN"
+                           " (SELECT rowid FROM books_fts WHERE books_fts MATCH :match)",
+                           {"match": match})
+        books = ((row[0], self._book(row)) for row in rows)
+        return book_output(fuzzy_rank(books, term_matches, limit), as_books)
+
+    def _order_by(self, sort_by):
+        return ", ".join(SQL_SORT_KEYS.get(sort_by, ()) + ("id",))
+
+    def list_books(self, sort_by="title", as_books=False):
+        rows = self._query(_SELECT_BOOK + " ORDER BY " + self._order_by(sort_by))
+        return book_output((self._book(row) for row in rows), as_books)
+
+    def list_books_page(self, sort_by="title", limit=50, cursor=None, as_books=False):
+        return self._page(sort_by, max(limit, 0), cursor, as_books=as_books)
+
+    def _page(self, sort_by, limit, cursor, where=(), params=(), as_books=False):
+        """Keyset pagination over the rows matching the where clauses"""
+        keys = SQL_SORT_KEYS.get(sort_by, ()) + ("id",)
+        sql = "SELECT id, %s, %s FROM books" % (", ".join(BOOK_COLUMNS), ", ".join(keys))
+        where, params = list(where), list(params)
+        if cursor:
+            after = decode_cursor(cursor)
+            if len(after) != len(keys):
+                raise ValueError(f"Invalid cursor: {cursor!r}")
+            where.append("(%s) > (%s)" % (", ".join(keys), ", ".join("?" * len(keys))))
+            params.extend(after)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY %s" % ", ".join(keys)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        rows = self._query(sql, params)
+        page = rows if limit is None else rows[:limit]
+        next_cursor = None
+        if page and limit is not None and len(rows) > limit:
+            next_cursor = encode_cursor(page[-1][len(BOOK_COLUMNS) + 1:])
+        return {
+            "books": book_output((self._book(row) for row in page), as_books),
+            "nextCursor": next_cursor
         }
-    
-    @classmethod
-    def from_dict(cls, data):
-        """Create a Book object from dictionary data"""
-        book = cls(
-            title=data["title"],
-            author=data["author"],
-            isbn=data.get("isbn", ""),
-            genre=data.get("genre", ""),
-            publication_year=data.get("publication_year"),
-            status=data.get("status", "Available"),
-            notes=data.get("notes", "")
-        )
-        book.date_added = data.get("date_added", book.date_added)
-        return book
+
+    def _facet_where(self, filters, skip=None):
+        where, params = [], []
+        for field, wanted in filters.items():
+            if field == skip:
+                continue
+            if field == "year":
+                low, high = wanted
+                where.append("publication_year")
+                if low is not None:
+                    where.append("publication_year >= ?")
+                    params.append(low)
+                if high is not None:
+                    where.append("publication_year <= ?")
+                    params.append(high)
+            else:
+                where.append("%s IN (%s)" % (field, ", ".join("?" * len(wanted))))
+                params.extend(wanted)
+        return where, params
+
+    def filter_books(self, filters, sort_by="title", limit=None, cursor=None, as_books=False):
+        where, params = self._facet_where(filters)
+        result = self._page(sort_by, None if limit is None else max(limit, 0),
+                            cursor, where, params, as_books)
+        sql = "SELECT COUNT(*) FROM books"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        result["total"] = self._query(sql, params)[0][0]
+        top_authors = [row[0] for row in self._query(
+            "SELECT author FROM books GROUP BY author ORDER BY COUNT(*) DESC, author LIMIT ?",
+            (FACET_AUTHORS,))]
+        authors = list(dict.fromkeys(top_authors + list(filters.get("author", ()))))
+        facets = {}
+        for field, column, condition, condition_params in (
+                ("genre", "genre", "genre != ''", []),
+                ("status", "status", "1", []),
+                ("author", "author", "author IN (%s)" % ", ".join("?" * len(authors)), authors),
+                ("year", "publication_year", "publication_year", [])):
+            where, params = self._facet_where(filters, skip=field)
+            facets[field] = self._counts(column, "WHERE " + " AND ".join(where + [condition]),
+                                         params + condition_params)
+        result["facets"] = facets
+        return result
+
+    def _counts(self, column, condition="", params=()):
+        rows = self._query("SELECT %s, COUNT(*) FROM books %s GROUP BY %s"
+                           % (column, condition, column), params)
+        return dict(rows)
+
+    def get_stats(self):
+        year = date.today().year
+        total = self._query("SELECT COUNT(*) FROM books")[0][0]
+        if not total:
+            return {"total_books": 0}
+        genres = self._counts("genre", "WHERE genre != ''")
+        statuses = self._counts("status")
+        authors = self._counts("author")
+        years = self._counts("publication_year", "WHERE publication_year")
+        return {
+            "total_books": total,
+            "genres": genres,
+            "statuses": statuses,
+            "authors": authors,
+            "years": years,
+            "top_genre": max(genres.items(), key=lambda x: x[1])[0] if genres else None,
+            "top_author": max(authors.items(), key=lambda x: x[1])[0] if authors else None,
+            "readingProgress": {
+                "booksReadThisYear": self._rollup("year", str(year), "Read"),
+                "booksReadLastYear": self._rollup("year", str(year - 1), "Read"),
+                "currentlyReading": statuses.get("Reading", 0)
+            }
+        }
+
+
+def library_stem(name):
+    """The file name stem of a library; names differing only in case or spaces share it"""
+    return name.lower().replace(' ', '_')
+
+
+def make_storage(name, persistence=None, backend=None):
+    """Build the storage backend for a library name"""
+    base = os.path.join(DATA_DIR, f"{library_stem(name)}_library")
+    if (backend or STORAGE_BACKEND) == "sqlite":
+        return SQLiteStorage(base + ".db", import_path=base + ".json")
+    return JSONStorage(base + ".json", persistence)
+
+
+BULK_BATCH = 1000        # books validated and persisted together by add_books
+EXPORT_BATCH = 1000      # books fetched or encoded per chunk when exporting
+
+
+def book_from_row(row):
+    """Validate one imported record and build a Book from it
+
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Record is not an object")
+    title = str(row.get("title") or "").strip()
+    author = str(row.get("author") or "").strip()
+    if not title:
+        raise ValueError("Missing title")
+    if not author:
+        raise ValueError("Missing author")
+    year = row.get("publication_year", row.get("publicationYear"))
+    if year in (None, ""):
+        year = None
+    else:
+        try:
+            year = int(year)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid publication year: {year!r}")
+    book = Book(
+        title=title,
+        author=author,
+        isbn=str(row.get("isbn") or ""),
+        genre=str(row.get("genre") or ""),
+        publication_year=year,
+        status=str(row.get("status") or "Available"),
+        notes=str(row.get("notes") or "")
+    )
+    added = row.get("date_added")
+    if added not in (None, ""):
+        try:
+            valid = date.fromisoformat(added).isoformat() == added
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            raise ValueError(f"Invalid date added: {added!r}, expected YYYY-MM-DD")
+        book.date_added = added
+    return book
+
+
+def read_book_rows(stream, fmt="ndjson"):
+    """Yield records from a JSON Lines or CSV text stream
+
+    Lines that are not valid JSON are yielded as the ValueError raised
+    for them, so callers can report them against their row.
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+
+DEDUP_THRESHOLD = 0.7       # shingle similarity at which two books count as duplicates
+DEDUP_PERMUTATIONS = 64     # MinHash signature length (a power of two)
+DEDUP_BANDS = 16            # LSH bands of 4 rows: pairs from ~0.5 similarity become candidates
+DEDUP_MAX_BUCKET = 20       # larger LSH buckets are chained instead of compared pairwise
+DEDUP_CHUNK = 2000          # records or pairs per worker task
+DEDUP_PARALLEL_MIN = 5000   # smaller catalogs are deduplicated in-process
+DEDUP_WORKERS = int(os.environ.get("LIBRARY_DEDUP_WORKERS", os.cpu_count() or 1))
+_BIN_BITS = DEDUP_PERMUTATIONS.bit_length() - 1
+
+
+def normalize_isbn(isbn):
+    """Reduce an ISBN-10 or ISBN-13, with any hyphens or spaces, to ISBN-13 digits"""
+    digits = re.sub(r"[^0-9X]", "", (isbn or "").upper())
+    if len(digits) == 10 and digits[:9].isdigit():
+        core = "978" + digits[:9]
+        total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(core))
+        return core + str(-total % 10)
+    return digits
+
+
+def dedup_key(book):
+    """Normalized (title, author) text: word tokens, author tokens sorted
+
+    Sorting makes "Tolkien, J. R. R." and "J.R.R. Tolkien" identical.
+    """
+    return " ".join(tokenize(book.title)), " ".join(sorted(tokenize(book.author)))
+
+
+def shingles(text):
+    """Character 3-grams of normalized text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)} if len(text) > 2 else {text}
+
+
+def _similarity(a, b):
+    return len(a & b) / len(a | b)
+
+
+def _minhash_chunk(records):
+    """MinHash signatures of the titles in (position, title) records
+
+    Uses one-permutation hashing: each shingle is hashed once, the low
+    bits pick a signature slot and the slot keeps the smallest value.
+    Empty slots borrow from the next filled one (rotation densification),
+    so similar titles still agree slot by slot.
+    """
+    signatures = []
+    mask = DEDUP_PERMUTATIONS - 1
+    for position, title in records:
+        if not title:
+            continue
+        slots = [None] * DEDUP_PERMUTATIONS
+        for shingle in shingles(title):
+            value = zlib.crc32(shingle.encode())
+            slot = value & mask
+            value >>= _BIN_BITS
+            if slots[slot] is None or value < slots[slot]:
+                slots[slot] = value
+        signature = []
+        for slot in range(DEDUP_PERMUTATIONS):
+            distance = 0
+            while slots[(slot + distance) & mask] is None:
+                distance += 1
+            signature.append(slots[(slot + distance) & mask] + (distance << 32))
+        signatures.append((position, tuple(signature)))
+    return signatures
+
+
+def _score_chunk(threshold, pairs):
+    """Score candidate pairs of (title, author) keys, keeping those over threshold
+
+    Titles and authors must both be similar; a missing author is not
+    held against a pair.
+    """
+    matches = []
+    cache = {}
+
+    def similarity(a, b):
+        for text in (a, b):
+            if text not in cache:
+                cache[text] = shingles(text)
+        return _similarity(cache[a], cache[b])
+
+    for left, right, (left_title, left_author), (right_title, right_author) in pairs:
+        score = similarity(left_title, right_title)
+        if score >= threshold and left_author and right_author:
+            score = min(score, similarity(left_author, right_author))
+        if score >= threshold:
+            matches.append((left, right, score))
+    return matches
+
+
+@contextlib.contextmanager
+def _dedup_pool(workers, size):
+    """A process pool for large catalogs, or None to work in-process
+
+    Workers are forked so they inherit this module instead of importing
+    it again, which would open the library files a second time.
+    """
+    if workers > 1 and size >= DEDUP_PARALLEL_MIN and "fork" in multiprocessing.get_all_start_methods():
+        with concurrent.futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            yield pool
+    else:
+        yield None
+
+
+def _map_chunks(pool, func, items):
+    chunks = [items[i:i + DEDUP_CHUNK] for i in range(0, len(items), DEDUP_CHUNK)]
+    results = pool.map(func, chunks) if pool is not None else map(func, chunks)
+    return itertools.chain.from_iterable(results)
+
+
+def find_duplicate_groups(books, threshold=DEDUP_THRESHOLD, workers=DEDUP_WORKERS):
+    """Cluster books sharing an ISBN or with near-identical titles and authors
+
+    ISBNs are compared after normalization. Titles are blocked with
+    MinHash/LSH so only books landing in a common bucket are scored on
+    title and author, and signatures and scores are computed across a
+    process pool.
+    Returns (positions, reasons) pairs, largest group first.
+    """
+    parent = list(range(len(books)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    edges = []
+    by_isbn = {}
+    for position, book in enumerate(books):
+        isbn = normalize_isbn(book.isbn)
+        if isbn:
+            by_isbn.setdefault(isbn, []).append(position)
+    for positions in by_isbn.values():
+        for left, right in zip(positions, positions[1:]):
+            edges.append((left, right, "isbn"))
+            parent[find(right)] = find(left)
+
+    keys = [dedup_key(book) for book in books]
+    rows = DEDUP_PERMUTATIONS // DEDUP_BANDS
+    with _dedup_pool(workers, len(books)) as pool:
+        buckets = {}
+        titles = [(position, key[0]) for position, key in enumerate(keys)]
+        for position, signature in _map_chunks(pool, _minhash_chunk, titles):
+            for band in range(DEDUP_BANDS):
+                key = (band, signature[band * rows:(band + 1) * rows])
+                buckets.setdefault(key, []).append(position)
+
+        candidates = set()
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) > DEDUP_MAX_BUCKET:
+                # Comparing neighbours in sorted order keeps a huge bucket
+                # linear; union-find still joins a chain of similar books
+                members = sorted(members, key=keys.__getitem__)
+                pairs = zip(members, members[1:])
+            else:
+                pairs = itertools.combinations(members, 2)
+            candidates.update((min(pair), max(pair)) for pair in pairs
+                              if find(pair[0]) != find(pair[1]))
+
+        pairs = [(left, right, keys[left], keys[right]) for left, right in sorted(candidates)]
+        for left, right, score in _map_chunks(pool, functools.partial(_score_chunk, threshold), pairs):
+            edges.append((left, right, "similar"))
+            parent[find(right)] = find(left)
+
+    groups = {}
+    for position in range(len(books)):
+        groups.setdefault(find(position), []).append(position)
+    reasons = {}
+    for left, right, reason in edges:
+        reasons.setdefault(find(left), set()).add(reason)
+    return sorted(((positions, reasons[root]) for root, positions in groups.items()
+                   if len(positions) > 1), key=lambda group: (-len(group[0]), group[0][0]))
+
+
+_VERSIONS = itertools.count(1)
+
 
 # Library class from our previous implementation
 class Library:
-    def __init__(self, name="My Library"):
+    def __init__(self, name="My Library", persistence=None, storage=None, lazy=None):
         self.name = name
-        self.books = []
-        self.file_path = f"{name.lower().replace(' ', '_')}_library.json"
-        self.load_from_file()
+        self._books = {}          # book id -> Book, in insertion order
+        self._next_id = 0
+        self._title_index = {}    # lowercased title -> [book ids]
+        self._isbn_index = {}     # ISBN -> [book ids]
+        self._search_index = SearchIndex()
+        self._stats = LibraryStats()
+        self._facets = FacetIndex()
+        self._events = EventLog()
+        self._sorted_views = {field: [] for field in SORT_KEYS}  # [(*key, book id)]
+        self._bulk = False
+        self._lock = ReadWriteLock()    # searches and lists share, mutations exclude
+        self.version = 0                # bumped by every change to the catalog
+        self._loaded = threading.Event()
+        self.storage = storage or make_storage(name, persistence)
+        self.file_path = self.storage.file_path
+        self.storage.open(self, lazy=LAZY_LOAD if lazy is None else lazy)
+
+    def _bump(self):
+        # Shared counter: versions never repeat across libraries or reloads
+        self.version = next(_VERSIONS)
+
+    @property
+    def loading(self):
+        """True while a lazy load is still adding books"""
+        return not self._loaded.is_set()
+
+    @property
+    def books(self):
+        """All books in insertion order"""
+        if self.storage.queryable:
+            return self.storage.iter_books()
+        return self._books.values()
         
+    @instrumented("add", count=None)
     def add_book(self, book):
         """Add a book to the library"""
-        self.books.append(book)
-        self.save_to_file()
+        if self.storage.queryable:
+            result = self.storage.add_book(book)
+            self._bump()
+            return result
+        self._loaded.wait()
+        at = int(time.time())
+        with self._lock.write(), self.storage.transaction(self):
+            self._apply_add(book)
+            self._persist({"op": "add", "book": book.to_dict()})
+            self._log_events(creation_events([book], at))
         return book.to_dict()
         
+    @instrumented("remove", count=None)
     def remove_book(self, book_identifier):
         """Remove a book by title or ISBN"""
-        for i, book in enumerate(self.books):
-            if (book.title.lower() == book_identifier.lower() or 
-                book.isbn == book_identifier):
-                removed_book = self.books.pop(i)
-                self.save_to_file()
-                return removed_book.to_dict()
-        return None
+        if self.storage.queryable:
+            result = self.storage.remove_book(book_identifier)
+            if result is not None:
+                self._bump()
+            return result
+        self._loaded.wait()
+        with self._lock.write(), self.storage.transaction(self):
+            removed_book = self._apply_remove(book_identifier)
+            if removed_book is None:
+                return None
+            self._persist({"op": "remove", "identifier": book_identifier})
+        return removed_book.to_dict()
     
-    def search_books(self, query):
-        """Search for books by title, author, or genre"""
+    @instrumented("search")
+    def search_books(self, query, mode=None, limit=None, threshold=None, as_books=False):
+        """Search for books by title, author, genre, or ISBN
+
+        In "index" mode results are ranked by field weight; "substring"
+        mode keeps the original scan-everything behaviour. "fuzzy" mode
+        ranks titles and authors by trigram similarity, dropping matches
+        below threshold. With as_books the Book objects are returned
+        instead of dicts, for encode_json.
+        """
+        if self.storage.queryable:
+            return self.storage.search_books(query, mode, limit, threshold, as_books)
+        if limit is not None:
+            limit = max(limit, 0)    # like SQL's LIMIT, a negative limit finds nothing
+        with self._lock.read():
+            mode = mode or SEARCH_MODE
+            if mode == "substring":
+                results = self._substring_search(query)
+            elif mode == "fuzzy":
+                results = self._fuzzy_search(query, limit, threshold)
+            else:
+                book_ids = self._search_index.search(query, limit=limit)
+                if book_ids is None:
+                    # No searchable terms: match everything, like an empty substring
+                    results = self.books
+                else:
+                    results = (self._books[book_id] for book_id in book_ids)
+            if limit is not None:
+                results = itertools.islice(results, limit)
+            return book_output(results, as_books)
+
+    @instrumented("add_many", count=lambda report: report["added"])
+    def add_books(self, records, batch_size=BULK_BATCH):
+        """Validate and add many books, persisting once per batch
+
+        records may hold Book objects or dicts as accepted by
+        book_from_row. Returns the number added and the per-row errors,
+        with rows numbered from 1.
+        """
+        report = {"added": 0, "errors": []}
+        batch = []
+        for row, record in enumerate(records, 1):
+            try:
+                if isinstance(record, Exception):
+                    raise ValueError(f"Invalid record: {record}")
+                book = record if isinstance(record, Book) else book_from_row(record)
+            except ValueError as e:
+                report["errors"].append({"row": row, "error": str(e)})
+                continue
+            batch.append((row, book))
+            if len(batch) >= batch_size:
+                report["added"] += self._insert_batch(batch, report["errors"])
+                batch = []
+        if batch:
+            report["added"] += self._insert_batch(batch, report["errors"])
+        report["errors"].sort(key=lambda error: error["row"])
+        return report
+
+    def _insert_batch(self, batch, errors):
+        """Add (row, book) pairs; books that fail are reported in errors, the rest persisted"""
+        if self.storage.queryable:
+            books = [book for _, book in batch]
+            try:
+                self.storage.add_books(books)
+            except sqlite3.Error as e:
+                # The batch is one transaction, so none of it was added
+                errors.extend({"row": row, "error": str(e)} for row, _ in batch)
+                return 0
+            self._bump()
+            return len(books)
+        self._loaded.wait()
+        added = []
+        with self._lock.write(), self.storage.transaction(self):
+            for row, book in batch:
+                try:
+                    self._apply_add(book)
+                except Exception as e:
+                    errors.append({"row": row, "error": str(e)})
+                    continue
+                added.append(book)
+            if added:
+                self._persist({"op": "add_many", "books": [book.to_dict() for book in added]})
+                self._log_events(creation_events(added, int(time.time())))
+        return len(added)
+
+    @instrumented("duplicates")
+    def find_duplicates(self, threshold=None, workers=None):
+        """Group books that look like duplicates of each other
+
+        Each group lists its books and why they were grouped: "isbn" for
+        matching normalized ISBNs, "similar" for near-identical titles and
+        authors.
+        """
+        if self.storage.queryable:
+            books = list(self.storage.iter_books())
+        else:
+            with self._lock.read():
+                books = list(self._books.values())
+        groups = find_duplicate_groups(books, DEDUP_THRESHOLD if threshold is None else threshold,
+                                       DEDUP_WORKERS if workers is None else workers)
+        return [{"reasons": sorted(reasons), "books": [books[i].to_dict() for i in positions]}
+                for positions, reasons in groups]
+
+    def encode_json(self, value):
+        """Yield a result of this library as JSON chunks; see encode_json"""
+        return encode_json(value, self._lock.read)
+
+    def export_books(self, fmt="ndjson"):
+        """Yield the catalog as NDJSON or CSV text, a chunk at a time"""
+        if self.storage.queryable:
+            books = self.storage.iter_books()
+        else:
+            # Only references are copied, so mutations can't break iteration
+            with self._lock.read():
+                books = list(self._books.values())
+        buffer = io.StringIO()
+        if fmt == "csv":
+            writer = csv.DictWriter(buffer, fieldnames=BOOK_COLUMNS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(book_data):
+                buffer.write(json.dumps(book_data) + "\n")
+        for i, book in enumerate(books, 1):
+            write(book.to_dict())
+            if i % EXPORT_BATCH == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def _fuzzy_search(self, query, limit, threshold):
+        if threshold is None:
+            threshold = FUZZY_THRESHOLD
+        book_ids = self._search_index.fuzzy_search(
+            query, threshold, None if limit is None else max(limit, 0))
+        if book_ids is None:
+            return self.books
+        return (self._books[book_id] for book_id in book_ids)
+
+    def _substring_search(self, query):
         query = query.lower()
         results = []
         
@@ -81,157 +2848,954 @@ class Library:
                 query in book.author.lower() or 
                 query in book.genre.lower() or 
                 query in book.isbn):
-                results.append(book.to_dict())
+                results.append(book)
                 
         return results
     
-    def list_books(self, sort_by="title"):
+    @instrumented("list")
+    def list_books(self, sort_by="title", as_books=False):
         """List all books, optionally sorted by a field"""
-        if not self.books:
-            return []
+        if self.storage.queryable:
+            return self.storage.list_books(sort_by, as_books)
+        with self._lock.read():
+            if not self._books:
+                return []
         
-        if sort_by == "title":
-            sorted_books = sorted(self.books, key=lambda x: x.title)
-        elif sort_by == "author":
-            sorted_books = sorted(self.books, key=lambda x: x.author)
-        elif sort_by == "year":
-            # Handle None values for publication_year
-            sorted_books = sorted(self.books, key=lambda x: (x.publication_year is None, x.publication_year))
-        elif sort_by == "date_added":
-            sorted_books = sorted(self.books, key=lambda x: x.date_added)
-        else:
-            sorted_books = self.books
+            if sort_by in self._sorted_views:
+                sorted_books = (self._books[entry[-1]] for entry in self._view(sort_by))
+            else:
+                sorted_books = self.books
             
-        return [book.to_dict() for book in sorted_books]
-    
+            return book_output(sorted_books, as_books)
+
+    @instrumented("list_page", count=lambda page: len(page["books"]))
+    def list_books_page(self, sort_by="title", limit=50, cursor=None, as_books=False):
+        """Return one page of books and the cursor for the next page"""
+        if self.storage.queryable:
+            return self.storage.list_books_page(sort_by, limit, cursor, as_books)
+        with self._lock.read():
+            if sort_by in self._sorted_views:
+                view = self._view(sort_by)
+            else:
+                # Ids are handed out in increasing order, so this is sorted too
+                view = [(book_id,) for book_id in self._books]
+            limit = max(limit, 0)
+            start = 0
+            if cursor:
+                try:
+                    start = bisect.bisect_right(view, decode_cursor(cursor))
+                except TypeError as e:
+                    raise ValueError(f"Invalid cursor: {cursor!r}") from e
+            page = view[start:start + limit]
+            next_cursor = None
+            if page and start + limit < len(view):
+                next_cursor = encode_cursor(page[-1])
+            return {
+                "books": book_output((self._books[entry[-1]] for entry in page), as_books),
+                "nextCursor": next_cursor
+            }
+
+    @instrumented("filter", count=lambda result: len(result["books"]))
+    def filter_books(self, filters, sort_by="title", limit=None, cursor=None, as_books=False):
+        """Books matching facet filters, with facet counts for the selection
+
+        Values within a facet are alternatives, facets must all match (see
+        FacetIndex.select). Pages and cursors work as in list_books_page;
+        without a limit every match is returned.
+        """
+        if self.storage.queryable:
+            return self.storage.filter_books(filters, sort_by, limit, cursor, as_books)
+        with self._lock.read():
+            selected = self._facets.select(filters)
+            total = selected.bit_count()
+            after = decode_cursor(cursor) if cursor else None
+            if sort_by in self._sorted_views and total * FACET_SORT_RATIO >= len(self._books):
+                # Most books match: walk the sorted view and skip the rest
+                view = self._view(sort_by)
+                table = bitmap_bytes(selected).ljust((self._next_id >> 3) + 1, b"\0")
+                start = self._bisect_cursor(view, after, cursor)
+                matches = (view[i] for i in range(start, len(view))
+                           if table[view[i][-1] >> 3] >> (view[i][-1] & 7) & 1)
+            else:
+                ids = bitmap_ids(selected)
+                if sort_by in self._sorted_views:
+                    key = SORT_KEYS[sort_by]
+                    entries = sorted(key(self._books[book_id]) + (book_id,) for book_id in ids)
+                else:
+                    entries = [(book_id,) for book_id in ids]
+                start = self._bisect_cursor(entries, after, cursor)
+                matches = iter(entries[start:])
+            if limit is None:
+                page, next_cursor = list(matches), None
+            else:
+                limit = max(limit, 0)
+                page = list(itertools.islice(matches, limit + 1))
+                next_cursor = None
+                if limit and len(page) > limit:
+                    page = page[:limit]
+                    next_cursor = encode_cursor(page[-1])
+            return {
+                "books": book_output((self._books[entry[-1]] for entry in page), as_books),
+                "total": total,
+                "facets": self._facets.counts(filters, self._stats.authors.most_common(FACET_AUTHORS)),
+                "nextCursor": next_cursor
+            }
+
+    @staticmethod
+    def _bisect_cursor(entries, after, cursor):
+        if after is None:
+            return 0
+        try:
+            return bisect.bisect_right(entries, after)
+        except TypeError as e:
+            raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+    @instrumented("stats", count=lambda stats: stats["total_books"])
     def get_stats(self):
         """Get statistics about the library"""
-        if not self.books:
-            return {"total_books": 0}
+        if self.storage.queryable:
+            return self.storage.get_stats()
+        year = date.today().year
+        with self._lock.read():
+            stats = self._stats
+            if not stats.total:
+                return {"total_books": 0}
         
-        genres = {}
-        statuses = {}
-        authors = {}
-        years = {}
+            statuses = stats.statuses.counts
+            return {
+                "total_books": stats.total,
+                "genres": dict(stats.genres.counts),
+                "statuses": dict(statuses),
+                "authors": dict(stats.authors.counts),
+                "years": dict(stats.years.counts),
+                "top_genre": stats.genres.top(),
+                "top_author": stats.authors.top(),
+                "readingProgress": {
+                    "booksReadThisYear": self._events.count("year", str(year), "Read"),
+                    "booksReadLastYear": self._events.count("year", str(year - 1), "Read"),
+                    "currentlyReading": statuses.get("Reading", 0)
+                }
+            }
+
+    @instrumented("series")
+    def status_series(self, period, start, end):
+        """Books moving into each status per period bucket from start to end, from the rollups"""
+        buckets = period_buckets(period, start, end)
+        if self.storage.queryable:
+            series = self.storage.status_series(period, buckets)
+        else:
+            with self._lock.read():
+                series = self._events.series(period, buckets)
+        return [{"bucket": bucket, "counts": counts} for bucket, counts in zip(buckets, series)]
+
+    def check_stats(self):
+        """Recompute the statistics from scratch and compare with the counters
+
+        Returns a list of the fields that disagree; empty when consistent.
+        """
+        if self.storage.queryable:
+            # SQL statistics are always computed from the rows themselves
+            return []
+        with self._lock.read():
+            genres = {}
+            statuses = {}
+            authors = {}
+            years = {}
         
-        for book in self.books:
-            # Count genres
-            if book.genre:
-                genres[book.genre] = genres.get(book.genre, 0) + 1
+            for book in self.books:
+                # Count genres
+                if book.genre:
+                    genres[book.genre] = genres.get(book.genre, 0) + 1
             
-            # Count statuses
-            statuses[book.status] = statuses.get(book.status, 0) + 1
+                # Count statuses
+                statuses[book.status] = statuses.get(book.status, 0) + 1
             
-            # Count authors
-            authors[book.author] = authors.get(book.author, 0) + 1
+                # Count authors
+                authors[book.author] = authors.get(book.author, 0) + 1
             
-            # Count publication years
-            if book.publication_year:
-                years[book.publication_year] = years.get(book.publication_year, 0) + 1
-        
-        return {
-            "total_books": len(self.books),
-            "genres": genres,
-            "statuses": statuses,
-            "authors": authors,
-            "years": years,
-            "top_genre": max(genres.items(), key=lambda x: x[1])[0] if genres else None,
-            "top_author": max(authors.items(), key=lambda x: x[1])[0] if authors else None,
-            "readingProgress": {
-                "booksReadThisYear": statuses.get("Read", 0),
-                "booksReadLastYear": 0,  # Would need date tracking for this
-                "currentlyReading": statuses.get("Reading", 0)
-            }
-        }
+                # Count publication years
+                if book.publication_year:
+                    years[book.publication_year] = years.get(book.publication_year, 0) + 1
+
+            stats = self._stats
+            mismatches = []
+            if stats.total != len(self.books):
+                mismatches.append("total_books")
+            for field, expected, histogram in (("genres", genres, stats.genres),
+                                               ("statuses", statuses, stats.statuses),
+                                               ("authors", authors, stats.authors),
+                                               ("years", years, stats.years)):
+                if histogram.counts != expected:
+                    mismatches.append(field)
+                top = histogram.top()
+                if (top is None) != (not expected) or (top is not None and
+                                                       expected.get(top) != max(expected.values())):
+                    mismatches.append(f"top of {field}")
+            return mismatches
     
+    @instrumented("status", count=None)
     def update_book_status(self, book_identifier, new_status):
-        """Update the status of a book"""
-        for book in self.books:
-            if (book.title.lower() == book_identifier.lower() or 
-                book.isbn == book_identifier):
-                book.status = new_status
-                self.save_to_file()
-                return book.to_dict()
+        """Update the status of a book; ValueError for a status that is not a non-empty string"""
+        check_status(new_status)
+        if self.storage.queryable:
+            result = self.storage.update_book_status(book_identifier, new_status)
+            if result is not None:
+                self._bump()
+            return result
+        self._loaded.wait()
+        at = int(time.time())
+        with self._lock.write(), self.storage.transaction(self):
+            book_id = self._find_book(book_identifier)
+            if book_id is None:
+                return None
+            old_status = self._books[book_id].status
+            book = self._apply_status(book_identifier, new_status)
+            self._persist({"op": "status", "identifier": book_identifier,
+                           "status": new_status})
+            if new_status != old_status:
+                self._log_events([(at, book.isbn or book.title, old_status, new_status)])
+        return book.to_dict()
+
+    def _log_events(self, events):
+        """Add status events to the analytics and the storage's event log; hold the write lock"""
+        for event in events:
+            self._events.add(*event)
+        self.storage.record_events(events)
+
+    def _find_book(self, book_identifier):
+        """Return the id of the first book matching a title or ISBN"""
+        by_title = self._title_index.get(book_identifier.lower())
+        by_isbn = self._isbn_index.get(book_identifier)
+        if by_title and by_isbn:
+            return min(by_title[0], by_isbn[0])
+        if by_title:
+            return by_title[0]
+        if by_isbn:
+            return by_isbn[0]
         return None
-    
-    def save_to_file(self):
-        """Save the library to a JSON file"""
+
+    def _index_book(self, book_id, book):
+        """Add a book to every index; if one fails, the others are rolled back"""
+        undo = []
         try:
-            with open(self.file_path, 'w') as file:
-                books_data = [book.to_dict() for book in self.books]
-                library_data = {
-                    "name": self.name,
-                    "books": books_data
-                }
-                json.dump(library_data, file, indent=4)
-            return True
-        except Exception as e:
-            print(f"Error saving library: {e}")
+            for index, key in ((self._title_index, book.title.lower()),
+                               (self._isbn_index, book.isbn)):
+                index.setdefault(key, []).append(book_id)
+                undo.append(functools.partial(self._drop_id, index, key, book_id))
+            self._search_index.add(book_id, book)
+            undo.append(lambda: self._search_index.remove(book_id, book))
+            self._stats.add(book)
+            undo.append(lambda: self._stats.remove(book))
+            self._facets.add(book_id, book)
+            undo.append(lambda: self._facets.remove(book_id, book))
+            for field, key in SORT_KEYS.items():
+                entry = key(book) + (book_id,)
+                view = self._sorted_views[field]
+                if self._bulk:
+                    view.append(entry)
+                    undo.append(view.pop)
+                else:
+                    bisect.insort(view, entry)
+                    undo.append(functools.partial(view.remove, entry))
+        except Exception:
+            for step in reversed(undo):
+                step()
+            raise
+
+    @staticmethod
+    def _drop_id(index, key, book_id):
+        ids = index[key]
+        ids.remove(book_id)
+        if not ids:
+            del index[key]
+
+    def _unindex_book(self, book_id, book):
+        for index, key in ((self._title_index, book.title.lower()),
+                           (self._isbn_index, book.isbn)):
+            self._drop_id(index, key, book_id)
+        self._search_index.remove(book_id, book)
+        self._stats.remove(book)
+        self._facets.remove(book_id, book)
+        for field, key in SORT_KEYS.items():
+            view = self._sorted_views[field]
+            del view[bisect.bisect_left(view, key(book) + (book_id,))]
+
+    def _clear(self):
+        self._books = {}
+        self._title_index = {}
+        self._isbn_index = {}
+        self._search_index = SearchIndex()
+        self._stats = LibraryStats()
+        self._facets = FacetIndex()
+        self._events = EventLog()
+        self._sorted_views = {field: [] for field in SORT_KEYS}
+        self._bulk = False
+        self._bump()
+
+    def _begin_bulk(self):
+        """Append to the sorted structures instead of inserting in place
+
+        Loading n books with bisect.insort is O(n^2); appending and
+        sorting once in _end_bulk is O(n log n).
+        """
+        self._bulk = True
+        self._search_index.bulk = True
+        self._facets.bulk = True
+
+    def _end_bulk(self):
+        for view in self._sorted_views.values():
+            view.sort()
+        self._search_index.finish_bulk()
+        self._facets.finish_bulk()
+        self._bulk = False
+
+    def _state(self):
+        """The catalog and its indexes as plain data, for the binary snapshot"""
+        books = self._books.values()
+        return {
+            "ids": list(self._books),
+            "columns": {field: [getattr(book, field) for book in books]
+                        for field in Book.FIELDS},
+            "next_id": self._next_id,
+            "title_index": self._title_index,
+            "isbn_index": self._isbn_index,
+            "search": self._search_index.state(),
+            "stats": self._stats.state(),
+            "facets": self._facets.state(),
+            "events": self._events.state(),
+            "views": self._sorted_views
+        }
+
+    def _restore(self, state):
+        """Inverse of _state; replaces everything currently loaded"""
+        columns = state["columns"]
+        books = {}
+        new = Book.__new__
+        for book_id, title, author, isbn, genre, year, status, notes, added in zip(
+                state["ids"], *(columns[field] for field in Book.FIELDS)):
+            book = new(Book)
+            book.title = title
+            book.author = author
+            book.isbn = isbn
+            book.genre = genre
+            book.publication_year = year
+            book.status = status
+            book.notes = notes
+            book._date_added = added
+            book._json = None
+            books[book_id] = book
+        self._books = books
+        self._next_id = state["next_id"]
+        self._title_index = state["title_index"]
+        self._isbn_index = state["isbn_index"]
+        self._search_index = SearchIndex.from_state(state["search"])
+        self._stats = LibraryStats.from_state(state["stats"])
+        self._facets = FacetIndex.from_state(state["facets"])
+        self._events = EventLog.from_state(state["events"])
+        self._sorted_views = state["views"]
+        self._bulk = False
+        self._bump()
+
+    def _view(self, sort_by):
+        """The sorted view for sort_by; a sorted copy while a bulk load runs"""
+        view = self._sorted_views[sort_by]
+        return sorted(view) if self._bulk else view
+
+    def _apply_add(self, book):
+        check_book(book)
+        book_id = self._next_id
+        # Indexed first, so a failure never leaves a half-added book visible
+        self._index_book(book_id, book)
+        self._next_id += 1
+        self._books[book_id] = book
+        self._bump()
+        return book_id
+
+    def _apply_remove(self, book_identifier):
+        book_id = self._find_book(book_identifier)
+        if book_id is None:
+            return None
+        book = self._books.pop(book_id)
+        self._unindex_book(book_id, book)
+        self._bump()
+        return book
+
+    def _apply_status(self, book_identifier, new_status):
+        book_id = self._find_book(book_identifier)
+        if book_id is None:
+            return None
+        book = self._books[book_id]
+        self._stats.change_status(book.status, new_status)
+        self._facets.change_status(book_id, book.status, new_status)
+        book.status = _intern(new_status)
+        book._json = None
+        self._bump()
+        return book
+
+    def _apply_record(self, record):
+        """Replay a single journal record against the in-memory library"""
+        op = record.get("op")
+        if op == "add":
+            self._apply_add(Book.from_dict(record["book"]))
+        elif op == "add_many":
+            for book_data in record["books"]:
+                self._apply_add(Book.from_dict(book_data))
+        elif op == "remove":
+            self._apply_remove(record["identifier"])
+        elif op == "status":
+            self._apply_status(record["identifier"], record["status"])
+
+    def _persist(self, record):
+        """Hand a mutation record to the storage backend
+
+        A failed write is noted on the request, for ?durable=1 to report.
+        """
+        written = self.storage.record(self, record)
+        if not written and has_request_context():
+            g.write_failed = True
+        return written
+
+    def refresh(self):
+        """Pick up changes other processes made to the library's files"""
+        if self.loading:
             return False
+        return self.storage.refresh(self)
+
+    def compact(self):
+        """Let the storage backend fold its change log into the main file"""
+        return self.storage.compact(self)
+    
+    def flush(self, timeout=None):
+        """Block until changes handed to a background writer are on disk"""
+        return self.storage.flush(timeout)
+
+    def close(self):
+        """Flush to disk and release files and background threads"""
+        self._loaded.wait()
+        self.storage.close(self)
+    
+    def save_to_file(self):
+        """Save the library to its storage file"""
+        return self.storage.save(self)
     
     def load_from_file(self):
-        """Load the library from a JSON file"""
-        if not os.path.exists(self.file_path):
-            return False
-        
+        """Load the library from its storage file"""
+        return self.storage.load(self)
+
+POOL_SIZE = int(os.environ.get("LIBRARY_POOL_SIZE", "64"))              # libraries kept loaded
+POOL_MAX_BOOKS = int(os.environ.get("LIBRARY_POOL_MAX_BOOKS", "2000000"))  # books across them
+_LIBRARY_NAME_RE = re.compile(r"^\w[\w .-]{0,63}$")
+
+
+class LibraryPool:
+    """Named libraries loaded on first use and evicted least-recently-used
+
+    A library stays loaded while a request holds it (acquire/release).
+    Cold libraries are flushed and closed when the pool exceeds its
+    library count or its total in-memory book budget. Libraries are
+    keyed on library_stem(), so names sharing a file share one instance.
+    """
+
+    def __init__(self, max_libraries=POOL_SIZE, max_books=POOL_MAX_BOOKS, factory=None):
+        self.max_libraries = max_libraries
+        self.max_books = max_books
+        self.factory = factory or (lambda name: Library(name, lazy=False))
+        self.loads = 0
+        self.evictions = 0
+        self._libraries = collections.OrderedDict()   # stem -> Library, coldest first
+        self._refs = {}
+        self._busy = set()     # names being loaded or closed
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def valid_name(name):
+        return bool(_LIBRARY_NAME_RE.match(name))
+
+    def acquire(self, name):
+        """Return the library called name, loading it if needed"""
+        stem = library_stem(name)
+        with self._cond:
+            while stem in self._busy:
+                self._cond.wait()
+            library = self._libraries.get(stem)
+            if library is not None:
+                self._libraries.move_to_end(stem)
+                self._refs[stem] += 1
+                return library
+            self._busy.add(stem)
         try:
-            with open(self.file_path, 'r') as file:
-                data = json.load(file)
-                self.name = data.get("name", self.name)
-                self.books = [Book.from_dict(book_data) for book_data in data.get("books", [])]
-            return True
-        except Exception as e:
-            print(f"Error loading library: {e}")
-            return False
+            library = self.factory(name)
+        except Exception:
+            with self._cond:
+                self._busy.discard(stem)
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._busy.discard(stem)
+            self._libraries[stem] = library
+            self._refs[stem] = 1
+            self.loads += 1
+            victims = self._take_victims()
+            self._cond.notify_all()
+        self._close(victims)
+        return library
+
+    def release(self, name):
+        with self._cond:
+            self._refs[library_stem(name)] -= 1
+            victims = self._take_victims()
+        self._close(victims)
+
+    def _take_victims(self):
+        """Remove cold libraries until the pool fits its budget"""
+        victims = []
+        books = sum(len(library._books) for library in self._libraries.values())
+        for name in list(self._libraries):
+            if len(self._libraries) <= self.max_libraries and books <= self.max_books:
+                break
+            if self._refs[name]:
+                continue
+            library = self._libraries.pop(name)
+            del self._refs[name]
+            books -= len(library._books)
+            self._busy.add(name)
+            victims.append((name, library))
+        return victims
+
+    def _close(self, victims):
+        for name, library in victims:
+            try:
+                library.close()
+            finally:
+                with self._cond:
+                    self._busy.discard(name)
+                    self.evictions += 1
+                    self._cond.notify_all()
+
+    def close_all(self):
+        with self._cond:
+            victims = [(name, self._libraries.pop(name)) for name in list(self._libraries)]
+            self._refs.clear()
+            self._busy.update(name for name, _ in victims)
+        self._close(victims)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "loaded": list(self._libraries),
+                "books": sum(len(library._books) for library in self._libraries.values()),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "maxLibraries": self.max_libraries,
+                "maxBooks": self.max_books
+            }
+
+
+CACHE_SIZE = int(os.environ.get("LIBRARY_CACHE_SIZE", "256"))   # cached responses
+CACHE_MAX_ENTRY = 8 * 1024 * 1024      # larger bodies are served but not cached
+CACHE_BYTES = int(os.environ.get("LIBRARY_CACHE_BYTES", str(64 * 1024 * 1024)))   # all cached bodies
+
+
+class ResponseCache:
+    """Bounded LRU of encoded responses keyed on (endpoint, params, version)
+
+    The LRU holds at most capacity entries and max_bytes of bodies in
+    total, so a run of large listings cannot pin gigabytes. Because the library version changes on every mutation, entries never
+    need invalidating; stale ones simply age out of the LRU.
+    """
+
+    def __init__(self, capacity=CACHE_SIZE, max_entry=CACHE_MAX_ENTRY, max_bytes=CACHE_BYTES):
+        self.capacity = capacity
+        self.max_entry = max_entry
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.epoch = uuid.uuid4().hex[:8]   # keeps ETags unique across restarts
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            # Versions count independently in each forked worker, so their
+            # ETags must not share an epoch
+            os.register_at_fork(after_in_child=self._new_epoch)
+
+    def _new_epoch(self):
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def etag(self, endpoint, params, version):
+        digest = zlib.crc32(repr((endpoint, params)).encode())
+        return f"{self.epoch}-{version}-{digest:08x}"
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > min(self.max_entry, self.max_bytes) or not self.capacity:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._entries[key] = body
+            self.bytes += len(body)
+            while len(self._entries) > self.capacity or self.bytes > self.max_bytes:
+                self.bytes -= len(self._entries.popitem(last=False)[1])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "notModified": self.not_modified,
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+                "bytes": self.bytes,
+                "maxBytes": self.max_bytes
+            }
+
+
+PROFILE_SLOW_MS = float(os.environ.get("LIBRARY_PROFILE_SLOW_MS", "0"))   # 0 disables profiling
+PROFILE_SAMPLE = float(os.environ.get("LIBRARY_PROFILE_SAMPLE", "0.01"))  # share of requests profiled
+PROFILE_DIR = os.environ.get("LIBRARY_PROFILE_DIR", "profiles")
+
+
+class SlowRequestProfiler:
+    """Run cProfile on a sample of requests and keep the slow ones
+
+    At most one request is profiled at a time so the profiler never
+    stacks up under load; the rest run untouched.
+    """
+
+    def __init__(self, slow_ms=PROFILE_SLOW_MS, sample=PROFILE_SAMPLE, directory=PROFILE_DIR):
+        self.slow_ms = slow_ms
+        self.sample = sample
+        self.directory = directory
+        self._busy = threading.Lock()
+
+    def start(self):
+        """Return a running profiler for this request, or None"""
+        if self.slow_ms <= 0 or random.random() >= self.sample:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, elapsed, label):
+        """Stop a profiler from start() and dump it if the request was slow"""
+        profile.disable()
+        self._busy.release()
+        if elapsed * 1000 < self.slow_ms:
+            return None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{elapsed * 1000:.0f}ms-{uuid.uuid4().hex[:6]}"
+            path = os.path.join(self.directory, name + ".prof")
+            profile.dump_stats(path)
+            metrics.inc("http_profiles_written_total")
+            return path
+        except OSError as e:
+            print(f"Error writing profile: {e}")
+            return None
+
 
 # Create a global library instance
-library = Library()
+DEFAULT_LIBRARY = "My Library"
+library = Library(DEFAULT_LIBRARY)
+library_pool = LibraryPool()
+atexit.register(library_pool.close_all)
+atexit.register(library.close)
+response_cache = ResponseCache()
+profiler = SlowRequestProfiler()
+
+
+def library_route(rule, **options):
+    """Register a view for the default library and under /api/libraries/<name>"""
+    def decorator(view):
+        app.route(rule, **options)(view)
+        scoped_rule = '/api/libraries/<name>' + rule[len('/api'):]
+        app.route(scoped_rule, endpoint=f"{view.__name__}_scoped", **options)(view)
+        return view
+    return decorator
+
+
+def _endpoint_label():
+    if request.endpoint is None:
+        return "unmatched"
+    return request.endpoint.removesuffix("_scoped")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profile = profiler.start()
+
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = _endpoint_label()
+    metrics.observe("http_request_seconds", elapsed, endpoint=endpoint,
+                    method=request.method, status=response.status_code)
+    if not response.is_streamed:
+        metrics.inc("http_response_bytes_total", response.content_length or 0, endpoint=endpoint)
+    if PROFILE_SLOW_MS and elapsed * 1000 >= PROFILE_SLOW_MS:
+        metrics.inc("http_slow_requests_total", endpoint=endpoint)
+    if g.profile is not None:
+        profiler.stop(g.profile, elapsed, endpoint)
+        g.profile = None
+    return response
+
+
+@app.before_request
+def bind_library():
+    """Point g.library at the library this request is addressed to"""
+    name = (request.view_args or {}).get('name')
+    g.library_name = None
+    if name is not None and not LibraryPool.valid_name(name):
+        return jsonify({"success": False, "message": f"Invalid library name: {name!r}"}), 400
+    if name is None or library_stem(name) == library_stem(DEFAULT_LIBRARY):
+        # The default library's own file must not get a second instance
+        g.library = library
+    else:
+        g.library = library_pool.acquire(name)
+        g.library_name = library_stem(name)
+    # Other worker processes may have changed the library since the last request
+    g.library.refresh()
+    return None
+
+
+DURABLE_TIMEOUT = 30    # seconds a ?durable=1 write waits for the disk
+
+
+@app.after_request
+def wait_for_durable_write(response):
+    """With ?durable=1 a change is acknowledged only once it is on disk
+
+    Without it, persistence modes that write in the background answer
+    as soon as the change is in memory.
+    """
+    if (request.method in ('POST', 'PUT', 'DELETE') and request.args.get('durable') == '1'
+            and g.get('library') is not None
+            and (g.get('write_failed') or not g.library.flush(DURABLE_TIMEOUT))):
+        response = jsonify({"success": False,
+                            "message": "The change could not be written to disk in time"})
+        response.status_code = 503
+    return response
+
+
+@app.teardown_request
+def release_library(exc):
+    if g.get('profile') is not None:
+        # The request failed before after_request could stop the profiler
+        profiler.stop(g.profile, time.perf_counter() - g.request_start, _endpoint_label())
+    if g.get('library_name'):
+        library_pool.release(g.library_name)
+
+
+def cached_response(endpoint, compute):
+    """Serve a read endpoint from the response cache, honouring If-None-Match
+
+    compute() returns the data to encode, or a finished (response, status)
+    tuple for errors, which are never cached.
+    """
+    params = (g.library_name,) + tuple(sorted(request.args.items(multi=True)))
+    version = g.library.version
+    etag = response_cache.etag(endpoint, params, version)
+    if request.if_none_match.contains(etag):
+        response_cache.not_modified += 1
+        response = app.response_class(status=304)
+    else:
+        key = (endpoint, params, version)
+        body = response_cache.get(key)
+        if body is None:
+            result = compute()
+            if isinstance(result, tuple):
+                return result
+            with metrics.timed("http_encode_seconds", endpoint=endpoint):
+                chunks = g.library.encode_json(result)
+                head, size = [], 0
+                for chunk in chunks:
+                    head.append(chunk)
+                    size += len(chunk)
+                    if size > response_cache.max_entry:
+                        break
+            if size > response_cache.max_entry:
+                # Too big to cache: stream the rest as it is encoded
+                body = itertools.chain(head, chunks)
+            else:
+                body = b"".join(head)
+                # Only cache what was computed against this exact version
+                if g.library.version == version:
+                    response_cache.put(key, body)
+        response = app.response_class(body, mimetype=app.json.mimetype)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def facet_filters(args):
+    """Facet filters from ?genre=&status=&author= (each repeatable) and ?year_min=&year_max="""
+    filters = {field: args.getlist(field) for field in ("genre", "status", "author")
+               if field in args}
+    if 'year_min' in args or 'year_max' in args:
+        filters["year"] = (args.get('year_min', type=int), args.get('year_max', type=int))
+    return filters
+
 
 # API Routes
-@app.route('/api/books', methods=['GET'])
-def get_books():
-    sort_by = request.args.get('sort', 'title')
-    return jsonify(library.list_books(sort_by))
+@library_route('/api/books', methods=['GET'])
+def get_books(name=None):
+    def compute():
+        sort_by = request.args.get('sort', 'title')
+        limit = request.args.get('limit', type=int)
+        filters = facet_filters(request.args)
+        if filters or request.args.get('facets') == '1':
+            try:
+                return g.library.filter_books(filters, sort_by, limit, request.args.get('cursor'),
+                                              as_books=True)
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+        if limit is None:
+            return g.library.list_books(sort_by, as_books=True)
+        try:
+            return g.library.list_books_page(sort_by, limit, request.args.get('cursor'),
+                                             as_books=True)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+    return cached_response('books', compute)
 
-@app.route('/api/books', methods=['POST'])
-def add_book():
-    data = request.json
-    book = Book(
-        title=data.get('title'),
-        author=data.get('author'),
-        isbn=data.get('isbn', ''),
-        genre=data.get('genre', ''),
-        publication_year=data.get('publicationYear'),
-        status=data.get('status', 'Available'),
-        notes=data.get('notes', '')
-    )
-    result = library.add_book(book)
+@library_route('/api/books', methods=['POST'])
+def add_book(name=None):
+    try:
+        book = book_from_row(request.json)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    result = g.library.add_book(book)
     return jsonify(result)
 
-@app.route('/api/books/<identifier>', methods=['DELETE'])
-def remove_book(identifier):
-    result = library.remove_book(identifier)
+@library_route('/api/books/<identifier>', methods=['DELETE'])
+def remove_book(identifier, name=None):
+    result = g.library.remove_book(identifier)
     if result:
         return jsonify({"success": True, "book": result})
     return jsonify({"success": False, "message": "Book not found"}), 404
 
-@app.route('/api/books/search', methods=['GET'])
-def search_books():
+@library_route('/api/books/bulk', methods=['POST'])
+def add_books_bulk(name=None):
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({"success": False, "message": f"Unsupported format: {fmt}"}), 400
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    report = g.library.add_books(read_book_rows(stream, fmt))
+    return jsonify({"success": not report["errors"], **report})
+
+@library_route('/api/books/export', methods=['GET'])
+def export_books(name=None):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({"success": False, "message": f"Unsupported format: {fmt}"}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(g.library.export_books(fmt), mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename=library.{fmt}"
+    })
+
+@library_route('/api/books/duplicates', methods=['GET'])
+def find_duplicates(name=None):
+    threshold = request.args.get('threshold', type=float)
+    current = g.library
+    return cached_response('duplicates', lambda: current.find_duplicates(threshold=threshold))
+
+@library_route('/api/books/search', methods=['GET'])
+def search_books(name=None):
     query = request.args.get('q', '')
-    return jsonify(library.search_books(query))
+    mode = request.args.get('mode')
+    limit = request.args.get('limit', type=int)
+    threshold = request.args.get('threshold', type=float)
+    current = g.library
+    return cached_response('search', lambda: current.search_books(
+        query, mode=mode, limit=limit, threshold=threshold, as_books=True))
 
-@app.route('/api/books/<identifier>/status', methods=['PUT'])
-def update_status(identifier):
+@library_route('/api/books/<identifier>/status', methods=['PUT'])
+def update_status(identifier, name=None):
     data = request.json
-    new_status = data.get('status')
-    result = library.update_book_status(identifier, new_status)
+    new_status = data.get('status') if isinstance(data, dict) else None
+    try:
+        result = g.library.update_book_status(identifier, new_status)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     if result:
         return jsonify({"success": True, "book": result})
     return jsonify({"success": False, "message": "Book not found"}), 404
 
-@app.route('/api/stats', methods=['GET'])
-def get_stats():
-    return jsonify(library.get_stats())
+@library_route('/api/stats', methods=['GET'])
+def get_stats(name=None):
+    return cached_response('stats', g.library.get_stats)
+
+def parse_period_date(value):
+    """A date from 2026, 2026-10 or 2026-10-18; missing parts default to the first"""
+    return date.fromisoformat((value + "-01-01")[:10])
+
+@library_route('/api/stats/timeseries', methods=['GET'])
+def get_status_series(name=None):
+    """Books moving into each status per day, month or year, served from the rollups"""
+    period = request.args.get('period', 'month')
+    if period not in STATUS_PERIODS:
+        return jsonify({"success": False, "message": f"Unknown period: {period!r}"}), 400
+    try:
+        end = parse_period_date(request.args['end']) if 'end' in request.args else date.today()
+        if 'start' in request.args:
+            start = parse_period_date(request.args['start'])
+        elif period == "day":
+            start = date.fromordinal(end.toordinal() - 29)
+        elif period == "month":
+            start = date(end.year - (end.month < 12), end.month % 12 + 1, 1)
+        else:
+            start = date(end.year - 9, 1, 1)
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid date: {e}"}), 400
+    if start > end:
+        return jsonify({"success": False, "message": "start is after end"}), 400
+    buckets = {"day": end.toordinal() - start.toordinal(),
+               "month": (end.year - start.year) * 12 + end.month - start.month,
+               "year": end.year - start.year}[period] + 1
+    if buckets > SERIES_MAX_BUCKETS:
+        return jsonify({"success": False, "message": f"More than {SERIES_MAX_BUCKETS} buckets"}), 400
+    series = g.library.status_series(period, start, end)
+    status = request.args.get('status')
+    if status is not None:
+        series = [{"bucket": entry["bucket"], "count": entry["counts"].get(status, 0)}
+                  for entry in series]
+    return jsonify({"period": period, "status": status, "series": series})
+
+@app.route('/api/libraries', methods=['GET'])
+def pool_stats():
+    return jsonify(library_pool.stats())
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    cache = response_cache.stats()
+    if not library.storage.queryable:
+        metrics.set("library_books", len(library._books))
+    metrics.set("library_pool_loaded", len(library_pool.stats()["loaded"]))
+    metrics.set("response_cache_entries", cache["entries"])
+    metrics.set("response_cache_bytes", cache["bytes"])
+    for result, key in (("hit", "hits"), ("miss", "misses"), ("not_modified", "notModified")):
+        metrics.set("response_cache_requests_total", cache[key], result=result)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats())
 
 @app.route('/api/hello', methods=['GET'])
 def hello_world():
@@ -0,0 +1,180 @@
+"""Compare requests per second of the Flask and the ASGI entry points.
+
+Each server is started in its own process over a scratch copy of a
+generated catalog, then a number of client threads, each on its own
+keep-alive connection, send a mix of reads (a page of books, a search,
+the stats) and writes (add a book, change its status) for a fixed time.
+Servers:
+
+    flask             api/index.py under a threaded WSGI server, with the
+                      default snapshot persistence (each write saves)
+    flask-background  the same with LIBRARY_PERSISTENCE=background
+    asgi              api/asgi.py under uvicorn (background persistence)
+    asgi-durable      the same, every write sent with ?durable=1
+
+Every write must be acknowledged and show up in the final book count.
+
+    python benchmarks/asgi_load.py [--books 20000] [--threads 16] [--seconds 10]
+                                   [--writes 0.2] [--servers flask,asgi]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "api"))
+sys.path.insert(0, BENCH_DIR)
+
+from catalog import WORDS, write_catalog  # noqa: E402
+
+FLASK_SERVER = """
+import sys
+sys.path.insert(0, {api_dir!r})
+from werkzeug.serving import WSGIRequestHandler, make_server
+import index
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+server = make_server("127.0.0.1", 0, index.app, threaded=True, request_handler=QuietHandler)
+print(server.port, flush=True)
+server.serve_forever()
+"""
+
+ASGI_SERVER = """
+import socket, sys
+sys.path.insert(0, {api_dir!r})
+import uvicorn
+import asgi
+
+sock = socket.socket()
+sock.bind(("127.0.0.1", 0))
+sock.listen(128)    # connections queue until uvicorn starts accepting
+print(sock.getsockname()[1], flush=True)
+uvicorn.Server(uvicorn.Config(asgi.app, log_level="warning")).run(sockets=[sock])
+"""
+
+SERVERS = {
+    "flask": (FLASK_SERVER, "snapshot", False),
+    "flask-background": (FLASK_SERVER, "background", False),
+    "asgi": (ASGI_SERVER, "background", False),
+    "asgi-durable": (ASGI_SERVER, "background", True),
+}
+
+
+def client(port, seconds, write_share, durable, seed, results):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    suffix = "?durable=1" if durable else ""
+    latencies = {"read": [], "write": []}
+    added, errors = 0, []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if rng.random() < write_share:
+            kind = "write"
+            if added and rng.random() < 0.5:
+                method, path = "PUT", f"/api/books/load-{seed}-{rng.randrange(added)}/status"
+                body = {"status": rng.choice(["Read", "Reading", "Available"])}
+            else:
+                method, path = "POST", "/api/books"
+                body = {"title": f"Load {seed} {added}", "author": f"Load {seed}",
+                        "isbn": f"load-{seed}-{added}", "genre": "Load"}
+            path += suffix
+        else:
+            kind, method, body = "read", "GET", None
+            path = rng.choice(["/api/books?limit=50&sort=author",
+                               f"/api/books/search?q={rng.choice(WORDS)}&limit=20",
+                               "/api/stats"])
+        started = time.perf_counter()
+        conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                     headers={"Content-Type": "application/json"} if body is not None else {})
+        response = conn.getresponse()
+        response.read()
+        latencies[kind].append(time.perf_counter() - started)
+        if response.status != 200:
+            errors.append(f"{method} {path}: {response.status}")
+        elif method == "POST":
+            added += 1
+    conn.close()
+    results.append((latencies, added, errors))
+
+
+def bench_server(name, books, threads, seconds, write_share):
+    code, persistence, durable = SERVERS[name]
+    data_dir = tempfile.mkdtemp(prefix="library-load-")
+    write_catalog(os.path.join(data_dir, "my_library_library.json"), books)
+    env = dict(os.environ, LIBRARY_DATA_DIR=data_dir, LIBRARY_PERSISTENCE=persistence,
+               LIBRARY_LAZY_LOAD="0")
+    server = subprocess.Popen([sys.executable, "-c", code.format(api_dir=API_DIR)], env=env,
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(server.stdout.readline())
+        results = []
+        clients = [threading.Thread(target=client,
+                                    args=(port, seconds, write_share, durable, n, results))
+                   for n in range(threads)]
+        started = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        conn.request("GET", "/api/stats")
+        total = json.loads(conn.getresponse().read())["total_books"]
+        conn.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    reads = [t for latencies, _, _ in results for t in latencies["read"]]
+    writes = [t for latencies, _, _ in results for t in latencies["write"]]
+    errors = [error for _, _, errs in results for error in errs]
+    added = sum(count for _, count, _ in results)
+    if errors or total != books + added:
+        raise SystemExit(f"{name}: {len(errors)} errors {errors[:3]}, "
+                         f"{total} books, expected {books + added}")
+
+    def ms(values, q):
+        return round(statistics.quantiles(values, n=100)[q - 1] * 1000, 2) if len(values) > 1 else None
+
+    return {
+        "requests_per_s": round((len(reads) + len(writes)) / elapsed, 1),
+        "reads": len(reads),
+        "writes": len(writes),
+        "read_p50_ms": ms(reads, 50),
+        "read_p99_ms": ms(reads, 99),
+        "write_p50_ms": ms(writes, 50),
+        "write_p99_ms": ms(writes, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=20000, help="catalog size")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--seconds", type=float, default=10, help="load duration per server")
+    parser.add_argument("--writes", type=float, default=0.2, help="share of requests that write")
+    parser.add_argument("--servers", default=",".join(SERVERS),
+                        help="comma separated servers to run: " + ", ".join(SERVERS))
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.servers.split(","):
+        print(f"loading {name}...", file=sys.stderr)
+        results[name] = bench_server(name, args.books, args.threads, args.seconds, args.writes)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
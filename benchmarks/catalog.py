@@ -0,0 +1,108 @@
+"""Deterministic generator of realistic synthetic library catalogs.
+
+Authors, genres, statuses and title words follow skewed (Zipf-like)
+distributions, so a few authors and genres dominate as in real
+collections. The same seed and size always give the same catalog.
+"""
+import itertools
+import json
+import random
+from datetime import date
+
+GENRES = ["Fiction", "Fantasy", "Science Fiction", "Mystery", "Romance", "Thriller",
+          "History", "Biography", "Non-fiction", "Poetry", "Horror", "Young Adult",
+          "Philosophy", "Travel", "Cookbooks", "Graphic Novels"]
+STATUSES = ["Available", "Read", "Reading", "Borrowed", "Wishlist"]
+STATUS_WEIGHTS = [50, 30, 8, 7, 5]
+WORDS = ("the of and night river stone king shadow house light dark city war love "
+         "secret garden winter summer fire sea star lost last empire song blood "
+         "iron glass silver golden ghost queen dragon storm wind road memory time "
+         "world heart crown forest mountain island moon sun dream truth journey").split()
+FIRST_NAMES = ("James Mary John Patricia Robert Jennifer Michael Linda William Elizabeth "
+               "David Barbara Richard Susan Joseph Jessica Thomas Sarah Ursula Haruki "
+               "Chimamanda Gabriel Toni Neil Terry Octavia Isaac Agatha").split()
+LAST_NAMES = ("Smith Johnson Williams Brown Jones Garcia Miller Davis Rodriguez Martinez "
+              "Hernandez Lopez Gonzalez Wilson Anderson Thomas Taylor Moore Jackson Martin "
+              "Le Guin Murakami Adichie Marquez Morrison Gaiman Pratchett Butler Asimov "
+              "Christie Tolkien Atwood").split()
+
+
+def _zipf_cum_weights(count, exponent=1.1):
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def _isbn13(rng):
+    digits = [9, 7, 8] + [rng.randrange(10) for _ in range(9)]
+    check = (10 - sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return "".join(map(str, digits + [check]))
+
+
+def generate_books(size, seed=1234):
+    """Yield size book dicts in the library file format"""
+    rng = random.Random(seed)
+    author_count = max(10, size // 8)
+    authors = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {n}" for n in range(author_count)]
+    author_weights = _zipf_cum_weights(author_count)
+    genre_weights = _zipf_cum_weights(len(GENRES), 0.8)
+    word_weights = _zipf_cum_weights(len(WORDS), 0.9)
+    first_day = date(2015, 1, 1).toordinal()
+    last_day = date(2025, 12, 31).toordinal()
+
+    for n in range(size):
+        words = rng.choices(WORDS, cum_weights=word_weights, k=rng.randint(1, 4))
+        year = None if rng.random() < 0.05 else min(2025, max(1800, int(rng.gauss(1995, 25))))
+        yield {
+            "title": " ".join(words).title() + f" {n}",
+            "author": rng.choices(authors, cum_weights=author_weights)[0],
+            "isbn": _isbn13(rng) if rng.random() < 0.9 else "",
+            "genre": rng.choices(GENRES, cum_weights=genre_weights)[0] if rng.random() < 0.95 else "",
+            "publication_year": year,
+            "status": rng.choices(STATUSES, weights=STATUS_WEIGHTS)[0],
+            "notes": "",
+            "date_added": date.fromordinal(rng.randint(first_day, last_day)).isoformat(),
+        }
+
+
+def sample_queries(size, seed=1234, count=20):
+    """Search terms drawn from the catalog: common words, authors and prefixes"""
+    rng = random.Random(seed + 1)
+    books = list(itertools.islice(generate_books(min(size, 5000), seed), 5000))
+    queries = []
+    for _ in range(count):
+        book = rng.choice(books)
+        kind = rng.randrange(4)
+        if kind == 0:
+            queries.append(book["title"].split()[0].lower())
+        elif kind == 1:
+            queries.append(book["author"].split()[1])
+        elif kind == 2:
+            queries.append(book["title"].split()[0][:3].lower())
+        else:
+            queries.append(" ".join(book["title"].split()[:2]).lower())
+    return queries
+
+
+def sample_typos(size, seed=1234, count=20):
+    """sample_queries with one adjacent pair of letters swapped in each word"""
+    rng = random.Random(seed + 2)
+    typos = []
+    for query in sample_queries(size, seed, count):
+        words = []
+        for word in query.split():
+            if len(word) > 3:
+                i = rng.randrange(1, len(word) - 1)
+                word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+            words.append(word)
+        typos.append(" ".join(words))
+    return typos
+
+
+def write_catalog(path, size, seed=1234, name="Benchmark Library"):
+    """Write a generated catalog as a compact library JSON file"""
+    with open(path, "w") as file:
+        file.write(json.dumps({"name": name})[:-1] + ', "books": [')
+        for n, book in enumerate(generate_books(size, seed)):
+            if n:
+                file.write(",")
+            file.write(json.dumps(book))
+        file.write("]}")
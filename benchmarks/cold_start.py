@@ -0,0 +1,93 @@
+"""Compare API cold-start time from JSON and from the binary snapshot.
+
+For each catalog size a library is generated in a scratch data directory
+and api/index.py is imported in fresh interpreters, the way a serverless
+deploy starts. Three paths are timed:
+
+    json      snapshot cache disabled, the JSON file is parsed
+    snapshot  the binary snapshot matches the JSON and is restored
+    stale     the JSON changed since the snapshot, so startup falls back
+
+"import" is the time until the module (and the global library) is
+loaded; "first request" adds one GET /api/books?limit=1.
+
+    python benchmarks/cold_start.py [--sizes 10000,100000] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BENCH_DIR, "..", "api")
+sys.path.insert(0, BENCH_DIR)
+
+from catalog import write_catalog  # noqa: E402
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {api_dir!r})
+import index
+imported = time.perf_counter()
+index.app.test_client().get("/api/books?limit=1")
+served = time.perf_counter()
+if {write_cache!r}:
+    index.library.storage.write_cache(index.library)
+print(imported - started, served - started, len(index.library.books))
+"""
+
+
+def run(data_dir, cache, write_cache=False):
+    env = dict(os.environ, LIBRARY_DATA_DIR=data_dir, LIBRARY_PERSISTENCE="snapshot",
+               LIBRARY_LAZY_LOAD="0", LIBRARY_SNAPSHOT_CACHE="1" if cache else "0")
+    code = PROBE.format(api_dir=os.path.abspath(API_DIR), write_cache=write_cache)
+    output = subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                            capture_output=True, text=True).stdout.split()
+    return float(output[-3]), float(output[-2]), int(output[-1])
+
+
+def bench_size(size, repeat):
+    data_dir = tempfile.mkdtemp(prefix="library-cold-start-")
+    path = os.path.join(data_dir, "my_library_library.json")
+    write_catalog(path, size)
+    json_runs = [run(data_dir, cache=False) for _ in range(repeat)]
+
+    run(data_dir, cache=True, write_cache=True)
+    snapshot_runs = [run(data_dir, cache=True) for _ in range(repeat)]
+
+    stale_runs = []
+    for _ in range(repeat):
+        os.utime(path)    # a newer mtime invalidates the snapshot
+        stale_runs.append(run(data_dir, cache=True))
+
+    results = {}
+    for name, runs in (("json", json_runs), ("snapshot", snapshot_runs), ("stale", stale_runs)):
+        assert all(books == size for _, _, books in runs), f"{name} loaded the wrong catalog"
+        results[name] = {
+            "import_s": round(statistics.median(imported for imported, _, _ in runs), 3),
+            "first_request_s": round(statistics.median(served for _, served, _ in runs), 3),
+        }
+    results["snapshot_bytes"] = os.path.getsize(path + ".snap")
+    results["json_bytes"] = os.path.getsize(path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000", help="comma separated catalog sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="interpreter starts per path")
+    args = parser.parse_args()
+
+    results = {}
+    for size in (int(value) for value in args.sizes.split(",")):
+        print(f"cold-starting {size} books...", file=sys.stderr)
+        results[str(size)] = bench_size(size, args.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
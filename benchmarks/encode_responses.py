@@ -0,0 +1,111 @@
+"""Compare response encoding with and without pre-encoded book fragments.
+
+A generated catalog is loaded into the API and the full-catalog listing
+and a large search result are requested repeatedly through the Flask
+test client, with the response cache disabled so every request is
+encoded again. Three ways of encoding are timed:
+
+    jsonify     books converted with to_dict() and passed to jsonify,
+                as the API did before fragments
+    cold        books encoded with to_json() but nothing kept
+                (LIBRARY_FRAGMENT_CACHE=0)
+    fragments   cached to_json() fragments concatenated (the default)
+
+The bodies must be byte-for-byte identical in every mode.
+
+    python benchmarks/encode_responses.py [--sizes 10000,100000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "api"))
+sys.path.insert(0, BENCH_DIR)
+
+from catalog import write_catalog  # noqa: E402
+
+os.environ.setdefault("LIBRARY_DATA_DIR", tempfile.mkdtemp(prefix="library-encode-"))
+import index  # noqa: E402
+
+REQUESTS = {
+    "full_catalog": "/api/libraries/{name}/books",
+    "large_search": "/api/libraries/{name}/books/search?q=the",
+}
+
+
+def legacy_response(value):
+    """The encoding used before fragments: dicts all the way down, then jsonify"""
+    if type(value) is list:
+        value = [book.to_dict() if isinstance(book, index.Book) else book for book in value]
+    return index.jsonify(value)
+
+
+def time_requests(client, path, repeat):
+    timings, body = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        body = response.get_data()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), body
+
+
+def bench_size(size, repeat):
+    name = f"encode{size}"
+    write_catalog(os.path.join(index.DATA_DIR, f"{name}_library.json"), size)
+    client = index.app.test_client()
+    library = index.library_pool.acquire(name)
+    index.library_pool.release(name)
+    books = list(library.books)
+    index.response_cache.capacity = 0    # encode every request
+
+    results = {}
+    for request_name, template in REQUESTS.items():
+        path = template.format(name=name)
+        bodies, timings = {}, {}
+
+        encode_json = index.Library.encode_json
+        index.Library.encode_json = lambda self, value: iter([legacy_response(value).get_data()])
+        timings["jsonify"], bodies["jsonify"] = time_requests(client, path, repeat)
+        index.Library.encode_json = encode_json
+
+        index.FRAGMENT_CACHE = False
+        for book in books:
+            book._json = None
+        timings["cold"], bodies["cold"] = time_requests(client, path, repeat)
+
+        index.FRAGMENT_CACHE = True
+        client.get(path)    # fills the fragments
+        timings["fragments"], bodies["fragments"] = time_requests(client, path, repeat)
+
+        assert len(set(bodies.values())) == 1, f"{request_name}: bodies differ between modes"
+        results[request_name] = {
+            "bytes": len(bodies["fragments"]),
+            **{f"{mode}_ms": round(seconds * 1000, 2) for mode, seconds in timings.items()},
+            **{f"{mode}_mb_per_s": round(len(bodies[mode]) / seconds / 1e6, 1)
+               for mode, seconds in timings.items()},
+            "speedup": round(timings["jsonify"] / timings["fragments"], 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000", help="comma separated catalog sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="requests timed per mode")
+    args = parser.parse_args()
+
+    results = {}
+    for size in (int(value) for value in args.sizes.split(",")):
+        print(f"encoding {size} books...", file=sys.stderr)
+        results[str(size)] = bench_size(size, args.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Report the memory cost per book of the old and the current Book layout.
+
+Books are built from JSON records one at a time, the way load_from_file
+does, and the memory still held afterwards is measured with tracemalloc.
+
+    python benchmarks/memory_per_book.py [number of books]
+"""
+import json
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+
+from catalog import generate_books  # noqa: E402
+from library_manager import Book  # noqa: E402
+
+
+class LegacyBook:
+    """The Book layout before __slots__, interning and day ordinals"""
+
+    def __init__(self, title, author, isbn="", genre="", publication_year=None,
+                 status="Available", notes=""):
+        self.title = title
+        self.author = author
+        self.isbn = isbn
+        self.genre = genre
+        self.publication_year = publication_year
+        self.status = status
+        self.notes = notes
+        self.date_added = datetime.now().strftime("%Y-%m-%d")
+
+    @classmethod
+    def from_dict(cls, data):
+        book = cls(data["title"], data["author"], data.get("isbn", ""),
+                   data.get("genre", ""), data.get("publication_year"),
+                   data.get("status", "Available"), data.get("notes", ""))
+        book.date_added = data.get("date_added", book.date_added)
+        return book
+
+
+def make_records(count, seed=42):
+    """Deterministic JSON lines for a catalog with repeated authors and genres"""
+    return [json.dumps(book) for book in generate_books(count, seed)]
+
+
+def measure(book_class, records):
+    """Bytes retained per book after building every record"""
+    tracemalloc.start()
+    books = [book_class.from_dict(json.loads(record)) for record in records]
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(books) == len(records)
+    return retained / len(records)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    records = make_records(count)
+    before = measure(LegacyBook, records)
+    after = measure(Book, records)
+    print(f"books:          {count}")
+    print(f"before (bytes): {before:.1f} per book")
+    print(f"after (bytes):  {after:.1f} per book")
+    print(f"saving:         {100 * (1 - after / before):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
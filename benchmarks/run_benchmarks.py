@@ -0,0 +1,218 @@
+"""Time every Library operation and API route on synthetic catalogs.
+
+For each catalog size a library file is generated with catalog.py and
+loaded through api/index.py. Each operation is timed over several runs
+(median and p95 latency) and then run once more under tracemalloc for
+peak memory. Results are written as JSON and, when a baseline file is
+given, compared against it.
+
+    python benchmarks/run_benchmarks.py --sizes 1000,10000 --output results.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --sizes 1000,10000 --save-baseline
+
+Mutations are timed with journal persistence, so they measure the
+in-memory work plus one appended record rather than a full rewrite;
+save_to_file is timed on its own.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "api"))
+sys.path.insert(0, BENCH_DIR)
+
+from catalog import generate_books, sample_queries, sample_typos, write_catalog  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def measure(func, repeat):
+    """Median/p95 latency over repeat runs plus the peak memory of one run"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    entry = {
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "peak_kb": round(peak / 1024, 1),
+    }
+    if isinstance(result, (list, dict, bytes)):
+        entry["items"] = len(result)
+    return entry
+
+
+def bench_size(index, size, repeat):
+    path = os.path.abspath(f"bench_{size}_library.json")
+    write_catalog(path, size)
+    queries = sample_queries(size)
+    query_cycle = itertools.cycle(queries)
+    results = {}
+
+    def load():
+        return index.Library("bench", storage=index.JSONStorage(path, persistence="journal"),
+                             lazy=False)
+
+    results["load_from_file"] = measure(lambda: load() and None, max(1, repeat // 5))
+    library = load()
+    results["save_to_file"] = measure(library.save_to_file, max(1, repeat // 5))
+    results["search_books"] = measure(lambda: library.search_books(next(query_cycle)), repeat)
+    results["search_books_limit_20"] = measure(
+        lambda: library.search_books(next(query_cycle), limit=20), repeat)
+    typo_cycle = itertools.cycle(sample_typos(size))
+    results["search_books_fuzzy_limit_20"] = measure(
+        lambda: library.search_books(next(typo_cycle), mode="fuzzy", limit=20), repeat)
+    results["search_books_substring"] = measure(
+        lambda: library.search_books(next(query_cycle), mode="substring"), max(1, repeat // 5))
+    for sort_by in ("title", "author", "year", "date_added"):
+        results[f"list_books_{sort_by}"] = measure(
+            lambda: library.list_books(sort_by), max(1, repeat // 5))
+    results["list_books_page"] = measure(lambda: library.list_books_page("title", 50), repeat)
+    facet_cycle = itertools.cycle([
+        {"status": ["Read"]},
+        {"genre": ["Fantasy", "Science Fiction"], "year": (1990, 2010)},
+        {"genre": ["Mystery"], "status": ["Read", "Reading"], "year": (None, 1980)},
+    ])
+    results["filter_books_limit_50"] = measure(
+        lambda: library.filter_books(next(facet_cycle), "title", 50), repeat)
+    results["get_stats"] = measure(library.get_stats, repeat)
+
+    extra = iter(generate_books(10 ** 6, seed=size + 99))
+    pool = []   # identifiers of books added here, for the update/remove runs
+
+    def add():
+        book_data = next(extra)
+        pool.append(book_data["isbn"] or book_data["title"])
+        return library.add_book(index.Book.from_dict(book_data))
+
+    results["add_book"] = measure(add, repeat)
+    for _ in range(2 * (repeat + 1)):
+        add()
+    results["update_book_status"] = measure(
+        lambda: library.update_book_status(pool[len(pool) // 2], "Read"), repeat)
+    results["remove_book"] = measure(lambda: library.remove_book(pool.pop()), repeat)
+
+    index.library = library
+    client = index.app.test_client()
+
+    def get(url):
+        return lambda: client.get(url).data
+
+    routes = {
+        "GET /api/books": (get("/api/books"), max(1, repeat // 5)),
+        "GET /api/books?limit=50": (get("/api/books?limit=50"), repeat),
+        "GET /api/books?genre=&status=": (get("/api/books?genre=Fantasy&status=Read&limit=50"),
+                                          repeat),
+        "GET /api/books/search": (lambda: client.get(
+            "/api/books/search", query_string={"q": next(query_cycle)}).data, repeat),
+        "GET /api/stats": (get("/api/stats"), repeat),
+        "GET /api/books/export": (get("/api/books/export"), max(1, repeat // 5)),
+        "POST /api/books": (lambda: client.post("/api/books", json={
+            "title": "Route Book", "author": "Bench Author"}).data, repeat),
+    }
+    for name, (func, runs) in routes.items():
+        results[name] = measure(func, runs)
+    results["PUT /api/books/<id>/status"] = measure(
+        lambda: client.put(f"/api/books/{pool[0]}/status", json={"status": "Reading"}).data,
+        repeat)
+    results["DELETE /api/books/<id>"] = measure(
+        lambda: client.delete(f"/api/books/{pool.pop()}").data, repeat)
+
+    library.storage.compact(library)
+    os.remove(path)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return (size, operation, current, baseline) for every slower median"""
+    regressions = []
+    for size, operations in results.items():
+        for operation, entry in operations.items():
+            previous = baseline.get(size, {}).get(operation)
+            if previous and entry["median_ms"] > previous["median_ms"] * (1 + tolerance):
+                regressions.append((size, operation, entry["median_ms"], previous["median_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="comma separated catalog sizes, e.g. 1000,100000,5000000")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per fast operation")
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--baseline", default=None, help="baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"store the results as {os.path.relpath(DEFAULT_BASELINE)}")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown before a result counts as a regression")
+    args = parser.parse_args()
+    # The benchmark runs in a scratch directory; paths given are relative to here
+    output = args.output and os.path.abspath(args.output)
+    baseline_path = args.baseline and os.path.abspath(args.baseline)
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="library-bench-")
+    os.chdir(workdir)
+    os.environ.setdefault("LIBRARY_PERSISTENCE", "journal")
+    # load_from_file measures JSON parsing; cold_start.py covers the snapshot
+    os.environ.setdefault("LIBRARY_SNAPSHOT_CACHE", "0")
+    import index
+
+    results = {}
+    try:
+        for size in (int(value) for value in args.sizes.split(",")):
+            print(f"benchmarking {size} books...", file=sys.stderr)
+            results[str(size)] = bench_size(index, size, args.repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, "w") as file:
+            file.write(text + "\n")
+
+    if baseline_path:
+        with open(baseline_path) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for size, operation, current, previous in regressions:
+            print(f"REGRESSION {size} books, {operation}: {current:.3f} ms "
+                  f"(baseline {previous:.3f} ms)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("no regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
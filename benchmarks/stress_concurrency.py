@@ -0,0 +1,114 @@
+"""Hammer the Flask API from many threads and verify the saved library.
+
+Runs api/index.py under a threaded WSGI server in a scratch directory.
+Each worker adds its own books, updates some of them, deletes others,
+and searches and lists the whole time. At the end the library file is
+reloaded from disk and compared with the expected final state.
+
+    python benchmarks/stress_concurrency.py [threads] [books per thread] [persistence]
+"""
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api")
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                 headers=headers)
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, data
+
+
+def worker(port, worker_id, count, expected, errors):
+    try:
+        for i in range(count):
+            title = f"w{worker_id}-book{i}"
+            status, _ = request(port, "POST", "/api/books", {
+                "title": title, "author": f"Author {worker_id}",
+                "isbn": f"{worker_id}-{i}", "genre": "Stress"})
+            assert status == 200, f"add {title}: {status}"
+            if i % 3 == 0:
+                status, _ = request(port, "DELETE", f"/api/books/{worker_id}-{i}")
+                assert status == 200, f"delete {title}: {status}"
+            elif i % 3 == 1:
+                status, _ = request(port, "PUT", f"/api/books/{worker_id}-{i}/status",
+                                    {"status": "Read"})
+                assert status == 200, f"status {title}: {status}"
+                expected[title] = "Read"
+            else:
+                expected[title] = "Available"
+            if i % 5 == 0:
+                assert request(port, "GET", f"/api/books/search?q=w{worker_id}")[0] == 200
+                assert request(port, "GET", "/api/books?limit=20")[0] == 200
+                assert request(port, "GET", "/api/stats")[0] == 200
+    except Exception as e:
+        errors.append(f"worker {worker_id}: {e!r}")
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    persistence = sys.argv[3] if len(sys.argv) > 3 else "background"
+
+    os.chdir(tempfile.mkdtemp(prefix="library-stress-"))
+    os.environ["LIBRARY_PERSISTENCE"] = persistence
+    sys.path.insert(0, API_DIR)
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import index
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, index.app, threaded=True,
+                         request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    expected, errors = {}, []
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(server.port, n, per_thread, expected, errors))
+               for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    index.library.flush()
+    index.library.compact()
+    mismatches = index.library.check_stats()
+    reloaded = index.Library(index.library.name, persistence="snapshot")
+    on_disk = {book.title: book.status for book in reloaded.books}
+
+    requests_made = threads * per_thread * 2 + threads * (per_thread // 5 + 1) * 3
+    print(f"threads: {threads}, books per thread: {per_thread}, persistence: {persistence}")
+    print(f"elapsed: {elapsed:.2f}s, ~{requests_made / elapsed:.0f} requests/s")
+    problems = list(errors)
+    if mismatches:
+        problems.append(f"in-memory counters disagree: {mismatches}")
+    if on_disk != expected:
+        missing = set(expected) - set(on_disk)
+        extra = set(on_disk) - set(expected)
+        wrong = [t for t in expected if t in on_disk and on_disk[t] != expected[t]]
+        problems.append(f"file differs: {len(missing)} missing, {len(extra)} extra, "
+                        f"{len(wrong)} with the wrong status")
+    for problem in problems:
+        print("FAIL:", problem)
+    if problems:
+        sys.exit(1)
+    print(f"OK: {len(on_disk)} books on disk match the expected state")
+
+
+if __name__ == "__main__":
+    main()
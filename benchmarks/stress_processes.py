@@ -0,0 +1,146 @@
+"""Hammer several API worker processes sharing one library; check no write is lost.
+
+Starts api/index.py in a number of separate server processes over the same
+scratch directory with LIBRARY_PERSISTENCE=shared, the way a pre-forking
+WSGI server runs it. Each client thread adds books through one process,
+then updates or deletes them through another, so every change depends
+on a write made elsewhere. Compaction is made frequent so it races with
+the writers. At the end every process must list exactly the expected
+books and count every status change, and so must a library loaded fresh
+from disk.
+
+    python benchmarks/stress_processes.py [processes] [threads] [books per thread]
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api")
+COMPACT_THRESHOLD = 200    # journal records between compactions, low to force races
+
+SERVER = """
+import sys
+sys.path.insert(0, {api_dir!r})
+from werkzeug.serving import WSGIRequestHandler, make_server
+import index
+index.COMPACT_THRESHOLD = {compact_threshold}
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+server = make_server("127.0.0.1", 0, index.app, threaded=True, request_handler=QuietHandler)
+print(server.port, flush=True)
+server.serve_forever()
+"""
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                 headers=headers)
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, data
+
+
+def worker(ports, worker_id, count, expected, errors):
+    try:
+        for i in range(count):
+            title = f"w{worker_id}-book{i}"
+            writer = ports[(worker_id + i) % len(ports)]
+            other = ports[(worker_id + i + 1) % len(ports)]
+            status, _ = request(writer, "POST", "/api/books", {
+                "title": title, "author": f"Author {worker_id}",
+                "isbn": f"{worker_id}-{i}", "genre": "Stress"})
+            assert status == 200, f"add {title}: {status}"
+            # The book was added by another process; this one must see it
+            if i % 3 == 0:
+                status, _ = request(other, "DELETE", f"/api/books/{worker_id}-{i}")
+                assert status == 200, f"delete {title} elsewhere: {status}"
+            elif i % 3 == 1:
+                status, _ = request(other, "PUT", f"/api/books/{worker_id}-{i}/status",
+                                    {"status": "Read"})
+                assert status == 200, f"status {title} elsewhere: {status}"
+                expected[title] = "Read"
+            else:
+                status, data = request(other, "GET", f"/api/books/search?q={title}")
+                assert status == 200 and title in data.decode(), f"search {title} elsewhere"
+                expected[title] = "Available"
+    except Exception as e:
+        errors.append(f"worker {worker_id}: {e!r}")
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    per_thread = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+
+    data_dir = tempfile.mkdtemp(prefix="library-processes-")
+    env = dict(os.environ, LIBRARY_DATA_DIR=data_dir, LIBRARY_PERSISTENCE="shared",
+               LIBRARY_LAZY_LOAD="0")
+    code = SERVER.format(api_dir=os.path.abspath(API_DIR), compact_threshold=COMPACT_THRESHOLD)
+    servers = [subprocess.Popen([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE,
+                                text=True) for _ in range(processes)]
+    try:
+        ports = [int(server.stdout.readline()) for server in servers]
+        expected, errors = {}, []
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(ports, n, per_thread, expected, errors))
+                   for n in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        served, reads = [], []
+        for port in ports:
+            status, data = request(port, "GET", "/api/books")
+            served.append({book["title"]: book["status"] for book in json.loads(data)})
+            status, data = request(port, "GET", "/api/stats")
+            reads.append(json.loads(data)["readingProgress"]["booksReadThisYear"])
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    os.environ.update(LIBRARY_DATA_DIR=data_dir, LIBRARY_PERSISTENCE="shared")
+    sys.path.insert(0, API_DIR)
+    import index
+    mismatches = index.library.check_stats()
+    on_disk = {book.title: book.status for book in index.library.books}
+    reads.append(index.library.get_stats()["readingProgress"]["booksReadThisYear"])
+
+    print(f"processes: {processes}, threads: {threads}, books per thread: {per_thread}")
+    print(f"elapsed: {elapsed:.2f}s, ~{threads * per_thread * 2 / elapsed:.0f} writes/s")
+    problems = list(errors)
+    transitions = sum(status == "Read" for status in expected.values())
+    if any(count != transitions for count in reads):
+        problems.append(f"status events lost: {transitions} books read, processes report {reads}")
+    if mismatches:
+        problems.append(f"reloaded counters disagree: {mismatches}")
+    for name, books in [(f"process {n}", books) for n, books in enumerate(served)] + [
+            ("file", on_disk)]:
+        if books != expected:
+            missing = set(expected) - set(books)
+            extra = set(books) - set(expected)
+            wrong = [t for t in expected if t in books and books[t] != expected[t]]
+            problems.append(f"{name} differs: {len(missing)} missing, {len(extra)} extra, "
+                            f"{len(wrong)} with the wrong status")
+    for problem in problems:
+        print("FAIL:", problem)
+    if problems:
+        sys.exit(1)
+    print(f"OK: {len(on_disk)} books match in all {processes} processes and on disk")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,58 @@
+import concurrent.futures
+import functools
+import itertools
 import json
 import os
-from datetime import datetime
-from typing import Dict, List, Optional, Union
+import re
+import sqlite3
+import sys
+import zlib
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Share one copy of frequently repeated strings (genres, statuses, authors)"""
+    return sys.intern(value) if type(value) is str else value
+
 
 class Book:
+    # No per-instance __dict__: at millions of books it dominates memory
+    __slots__ = ("title", "author", "isbn", "genre", "publication_year",
+                 "status", "notes", "_date_added")
+
     def __init__(self, title: str, author: str, isbn: str = "", 
                  genre: str = "", publication_year: int = None, 
                  status: str = "Available", notes: str = ""):
         self.title = title
-        self.author = author
+        self.author = _intern(author)
         self.isbn = isbn
-        self.genre = genre
+        self.genre = _intern(genre)
         self.publication_year = publication_year
-        self.status = status  # Available, Borrowed, Read, etc.
+        self.status = _intern(status)  # Available, Borrowed, Read, etc.
         self.notes = notes
-        self.date_added = datetime.now().strftime("%Y-%m-%d")
+        self._date_added: Union[int, str] = date.today().toordinal()
+
+    @property
+    def date_added(self) -> str:
+        """The date the book was added, as YYYY-MM-DD"""
+        if type(self._date_added) is int:
+            return date.fromordinal(self._date_added).isoformat()
+        return self._date_added
+
+    @date_added.setter
+    def date_added(self, value: object) -> None:
+        # Stored as a day ordinal; other text is kept verbatim, other
+        # values (null in older files) as text
+        if type(value) is not str:
+            value = "" if value is None else str(value)
+        try:
+            parsed = date.fromisoformat(value)
+        except ValueError:
+            parsed = None
+        if parsed is not None and parsed.isoformat() == value:
+            self._date_added = parsed.toordinal()
+        else:
+            self._date_added = value
         
     def to_dict(self) -> Dict:
         """Convert book object to dictionary for JSON serialization"""
@@ -49,25 +87,302 @@ class Book:
         return f"{self.title} by {self.author} ({self.publication_year or 'Unknown'})"
 
 
+class JSONStorage:
+    """Stores a library as a single JSON file"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.file_path)
+
+    def load(self) -> Dict:
+        with open(self.file_path, 'r') as file:
+            return json.load(file)
+
+    def save(self, name: str, books: List[Book]) -> None:
+        with open(self.file_path, 'w') as file:
+            books_data = [book.to_dict() for book in books]
+            library_data = {
+                "name": name,
+                "books": books_data
+            }
+            json.dump(library_data, file, indent=4)
+
+
+class SQLiteStorage:
+    """Stores a library in an SQLite database with indexed columns"""
+
+    COLUMNS = ("title", "author", "isbn", "genre", "publication_year",
+               "status", "notes", "date_added")
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.file_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.file_path)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY, title TEXT, author TEXT, isbn TEXT,
+                genre TEXT, publication_year INTEGER, status TEXT, notes TEXT,
+                date_added TEXT
+            );
+            CREATE INDEX IF NOT EXISTS books_isbn ON books(isbn);
+            CREATE INDEX IF NOT EXISTS books_title ON books(title);
+            CREATE INDEX IF NOT EXISTS books_author ON books(author);
+            CREATE INDEX IF NOT EXISTS books_genre ON books(genre);
+            CREATE INDEX IF NOT EXISTS books_status ON books(status);
+            CREATE INDEX IF NOT EXISTS books_year ON books(publication_year);
+        """)
+        return conn
+
+    def load(self) -> Dict:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'name'").fetchone()
+            rows = conn.execute("SELECT %s FROM books ORDER BY id" % ", ".join(self.COLUMNS))
+            books = [dict(zip(self.COLUMNS, values)) for values in rows]
+        finally:
+            conn.close()
+        return {"name": row[0] if row else None, "books": books}
+
+    def save(self, name: str, books: List[Book]) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('name', ?)", (name,))
+                conn.execute("DELETE FROM books")
+                conn.executemany(
+                    "INSERT INTO books (%s) VALUES (%s)" % (", ".join(self.COLUMNS),
+                                                           ", ".join("?" * len(self.COLUMNS))),
+                    (tuple(getattr(book, column) for column in self.COLUMNS) for book in books))
+        finally:
+            conn.close()
+
+
+def make_storage(name: str, backend: Optional[str] = None) -> Union[JSONStorage, SQLiteStorage]:
+    """Build the storage backend for a library name ("json" or "sqlite")
+
+    The API keeps its own SQLite layout (full-text tables, triggers) in
+    <name>_library.db, so the CLI's database lives in <name>_library.cli.db.
+    """
+    base = f"{name.lower().replace(' ', '_')}_library"
+    if (backend or os.environ.get("LIBRARY_STORAGE", "json")) == "sqlite":
+        return SQLiteStorage(base + ".cli.db")
+    return JSONStorage(base + ".json")
+
+
+DEDUP_THRESHOLD = 0.7       # shingle similarity at which two books count as duplicates
+DEDUP_PERMUTATIONS = 64     # MinHash signature length (a power of two)
+DEDUP_BANDS = 16            # LSH bands of 4 rows
+DEDUP_MAX_BUCKET = 20       # larger LSH buckets are chained instead of compared pairwise
+DEDUP_CHUNK = 2000          # records or pairs per worker task
+DEDUP_PARALLEL_MIN = 5000   # smaller catalogs are deduplicated in-process
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize_isbn(isbn: str) -> str:
+    """Reduce an ISBN-10 or ISBN-13, with any hyphens or spaces, to ISBN-13 digits"""
+    digits = re.sub(r"[^0-9X]", "", (isbn or "").upper())
+    if len(digits) == 10 and digits[:9].isdigit():
+        core = "978" + digits[:9]
+        total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(core))
+        return core + str(-total % 10)
+    return digits
+
+
+def dedup_key(book: Book) -> Tuple[str, str]:
+    """Normalized (title, author) text: word tokens, author tokens sorted"""
+    title = _TOKEN_RE.findall(book.title.lower())
+    author = sorted(_TOKEN_RE.findall(book.author.lower()))
+    return " ".join(title), " ".join(author)
+
+
+def shingles(text: str) -> Set[str]:
+    """Character 3-grams of normalized text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)} if len(text) > 2 else {text}
+
+
+def _minhash_chunk(records: List[Tuple[int, str]]) -> List[Tuple[int, Tuple[int, ...]]]:
+    """One-permutation MinHash signatures of titles, densified by rotation"""
+    signatures = []
+    mask = DEDUP_PERMUTATIONS - 1
+    bits = DEDUP_PERMUTATIONS.bit_length() - 1
+    for position, title in records:
+        if not title:
+            continue
+        slots: List[Optional[int]] = [None] * DEDUP_PERMUTATIONS
+        for shingle in shingles(title):
+            value = zlib.crc32(shingle.encode())
+            slot = value & mask
+            value >>= bits
+            if slots[slot] is None or value < slots[slot]:
+                slots[slot] = value
+        signature = []
+        for slot in range(DEDUP_PERMUTATIONS):
+            distance = 0
+            while slots[(slot + distance) & mask] is None:
+                distance += 1
+            signature.append(slots[(slot + distance) & mask] + (distance << 32))
+        signatures.append((position, tuple(signature)))
+    return signatures
+
+
+def _score_chunk(threshold: float, pairs: List[Tuple]) -> List[Tuple[int, int]]:
+    """Keep candidate pairs whose titles and authors are both similar enough"""
+    matches = []
+    cache: Dict[str, Set[str]] = {}
+
+    def similarity(a: str, b: str) -> float:
+        for text in (a, b):
+            if text not in cache:
+                cache[text] = shingles(text)
+        return len(cache[a] & cache[b]) / len(cache[a] | cache[b])
+
+    for left, right, (left_title, left_author), (right_title, right_author) in pairs:
+        score = similarity(left_title, right_title)
+        if score >= threshold and left_author and right_author:
+            score = min(score, similarity(left_author, right_author))
+        if score >= threshold:
+            matches.append((left, right))
+    return matches
+
+
+def _map_chunks(pool: Optional[concurrent.futures.Executor], func, items: List) -> Iterator:
+    chunks = [items[i:i + DEDUP_CHUNK] for i in range(0, len(items), DEDUP_CHUNK)]
+    results = pool.map(func, chunks) if pool is not None else map(func, chunks)
+    return itertools.chain.from_iterable(results)
+
+
+def find_duplicate_groups(books: List[Book], threshold: float = DEDUP_THRESHOLD,
+                          workers: Optional[int] = None) -> List[List[int]]:
+    """Cluster books sharing an ISBN or with near-identical titles and authors
+
+    Titles are blocked with MinHash/LSH so only books sharing a bucket are
+    compared; large catalogs are hashed and scored across a process pool.
+    Returns lists of positions into books, largest group first.
+    """
+    parent = list(range(len(books)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    by_isbn: Dict[str, List[int]] = {}
+    for position, book in enumerate(books):
+        isbn = normalize_isbn(book.isbn)
+        if isbn:
+            by_isbn.setdefault(isbn, []).append(position)
+    for positions in by_isbn.values():
+        for left, right in zip(positions, positions[1:]):
+            parent[find(right)] = find(left)
+
+    keys = [dedup_key(book) for book in books]
+    rows = DEDUP_PERMUTATIONS // DEDUP_BANDS
+    workers = workers if workers is not None else os.cpu_count() or 1
+    pool = None
+    if workers > 1 and len(books) >= DEDUP_PARALLEL_MIN:
+        pool = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        buckets: Dict[Tuple, List[int]] = {}
+        titles = [(position, key[0]) for position, key in enumerate(keys)]
+        for position, signature in _map_chunks(pool, _minhash_chunk, titles):
+            for band in range(DEDUP_BANDS):
+                key = (band, signature[band * rows:(band + 1) * rows])
+                buckets.setdefault(key, []).append(position)
+
+        candidates = set()
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) > DEDUP_MAX_BUCKET:
+                members = sorted(members, key=keys.__getitem__)
+                pairs = zip(members, members[1:])
+            else:
+                pairs = itertools.combinations(members, 2)
+            candidates.update((min(pair), max(pair)) for pair in pairs
+                              if find(pair[0]) != find(pair[1]))
+
+        pairs = [(left, right, keys[left], keys[right]) for left, right in sorted(candidates)]
+        for left, right in _map_chunks(pool, functools.partial(_score_chunk, threshold), pairs):
+            parent[find(right)] = find(left)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    groups: Dict[int, List[int]] = {}
+    for position in range(len(books)):
+        groups.setdefault(find(position), []).append(position)
+    return sorted((positions for positions in groups.values() if len(positions) > 1),
+                  key=lambda positions: (-len(positions), positions[0]))
+
+
 class Library:
-    def __init__(self, name: str = "My Library"):
+    def __init__(self, name: str = "My Library",
+                 storage: Optional[Union[JSONStorage, SQLiteStorage]] = None):
         self.name = name
-        self.books: List[Book] = []
-        self.file_path = f"{name.lower().replace(' ', '_')}_library.json"
+        self._books: Dict[int, Book] = {}          # book id -> Book, in insertion order
+        self._next_id = 0
+        self._title_index: Dict[str, List[int]] = {}  # lowercased title -> book ids
+        self._isbn_index: Dict[str, List[int]] = {}   # ISBN -> book ids
+        self.storage = storage or make_storage(name)
+        self.file_path = self.storage.file_path
+
+    @property
+    def books(self) -> List[Book]:
+        """All books in insertion order"""
+        return list(self._books.values())
+
+    def _find_book(self, book_identifier: str) -> Optional[int]:
+        """Return the id of the first book matching a title or ISBN"""
+        by_title = self._title_index.get(book_identifier.lower())
+        by_isbn = self._isbn_index.get(book_identifier)
+        if by_title and by_isbn:
+            return min(by_title[0], by_isbn[0])
+        if by_title:
+            return by_title[0]
+        if by_isbn:
+            return by_isbn[0]
+        return None
+
+    def _index_book(self, book_id: int, book: Book) -> None:
+        self._title_index.setdefault(book.title.lower(), []).append(book_id)
+        self._isbn_index.setdefault(book.isbn, []).append(book_id)
+
+    def _unindex_book(self, book_id: int, book: Book) -> None:
+        for index, key in ((self._title_index, book.title.lower()),
+                           (self._isbn_index, book.isbn)):
+            ids = index[key]
+            ids.remove(book_id)
+            if not ids:
+                del index[key]
+
+    def _insert(self, book: Book) -> int:
+        book_id = self._next_id
+        self._next_id += 1
+        self._books[book_id] = book
+        self._index_book(book_id, book)
+        return book_id
         
     def add_book(self, book: Book) -> None:
         """Add a book to the library"""
-        self.books.append(book)
+        self._insert(book)
         print(f"Added: {book}")
         
     def remove_book(self, book_identifier: str) -> bool:
         """Remove a book by title or ISBN"""
-        for i, book in enumerate(self.books):
-            if (book.title.lower() == book_identifier.lower() or 
-                book.isbn == book_identifier):
-                removed_book = self.books.pop(i)
-                print(f"Removed: {removed_book}")
-                return True
+        book_id = self._find_book(book_identifier)
+        if book_id is not None:
+            removed_book = self._books.pop(book_id)
+            self._unindex_book(book_id, removed_book)
+            print(f"Removed: {removed_book}")
+            return True
         print(f"Book '{book_identifier}' not found in library.")
         return False
     
@@ -87,7 +402,7 @@ class Library:
     
     def list_books(self, sort_by: str = "title") -> List[Book]:
         """List all books, optionally sorted by a field"""
-        if not self.books:
+        if not self._books:
             print("Library is empty.")
             return []
         
@@ -107,7 +422,7 @@ class Library:
     
     def get_stats(self) -> Dict:
         """Get statistics about the library"""
-        if not self.books:
+        if not self._books:
             return {"total_books": 0}
         
         genres = {}
@@ -131,7 +446,7 @@ class Library:
                 years[book.publication_year] = years.get(book.publication_year, 0) + 1
         
         return {
-            "total_books": len(self.books),
+            "total_books": len(self._books),
             "genres": genres,
             "statuses": statuses,
             "authors": authors,
@@ -142,25 +457,25 @@ class Library:
     
     def update_book_status(self, book_identifier: str, new_status: str) -> bool:
         """Update the status of a book"""
-        for book in self.books:
-            if (book.title.lower() == book_identifier.lower() or 
-                book.isbn == book_identifier):
-                book.status = new_status
-                print(f"Updated status of '{book.title}' to '{new_status}'")
-                return True
+        book_id = self._find_book(book_identifier)
+        if book_id is not None:
+            book = self._books[book_id]
+            book.status = _intern(new_status)
+            print(f"Updated status of '{book.title}' to '{new_status}'")
+            return True
         print(f"Book '{book_identifier}' not found in library.")
         return False
     
+    def find_duplicates(self, threshold: float = DEDUP_THRESHOLD) -> List[List[Book]]:
+        """Group books that look like duplicates of each other"""
+        books = self.books
+        return [[books[i] for i in positions]
+                for positions in find_duplicate_groups(books, threshold)]
+
     def save_to_file(self) -> bool:
-        """Save the library to a JSON file"""
+        """Save the library to its storage file"""
         try:
-            with open(self.file_path, 'w') as file:
-                books_data = [book.to_dict() for book in self.books]
-                library_data = {
-                    "name": self.name,
-                    "books": books_data
-                }
-                json.dump(library_data, file, indent=4)
+            self.storage.save(self.name, self.books)
             print(f"Library saved to {self.file_path}")
             return True
         except Exception as e:
@@ -168,17 +483,20 @@ class Library:
             return False
     
     def load_from_file(self) -> bool:
-        """Load the library from a JSON file"""
-        if not os.path.exists(self.file_path):
+        """Load the library from its storage file"""
+        if not self.storage.exists():
             print(f"No library file found at {self.file_path}")
             return False
         
         try:
-            with open(self.file_path, 'r') as file:
-                data = json.load(file)
-                self.name = data.get("name", self.name)
-                self.books = [Book.from_dict(book_data) for book_data in data.get("books", [])]
-            print(f"Loaded {len(self.books)} books from {self.file_path}")
+            data = self.storage.load()
+            self.name = data.get("name") or self.name
+            self._books = {}
+            self._title_index = {}
+            self._isbn_index = {}
+            for book_data in data.get("books", []):
+                self._insert(Book.from_dict(book_data))
+            print(f"Loaded {len(self._books)} books from {self.file_path}")
             return True
         except Exception as e:
             print(f"Error loading library: {e}")
@@ -226,9 +544,10 @@ def main():
         print("5. View library statistics")
         print("6. Update book status")
         print("7. Save library")
-        print("8. Exit")
+        print("8. Find duplicate books")
+        print("9. Exit")
         
-        choice = input("\nEnter your choice (1-8): ")
+        choice = input("\nEnter your choice (1-9): ")
         
         if choice == '1':
             # Add a book
@@ -318,6 +637,14 @@ def main():
             library.save_to_file()
             
         elif choice == '8':
+            # Find duplicate books
+            groups = library.find_duplicates()
+            print(f"\nFound {len(groups)} groups of possible duplicates:")
+            for number, group in enumerate(groups, 1):
+                print(f"\nGroup {number}:")
+                display_books(group)
+            
+        elif choice == '9':
             # Exit
             save_choice = input("Save library before exiting? (y/n): ")
             if save_choice.lower() == 'y':